@@ -9,11 +9,10 @@ A set of tools for cleaning, standardising and combining multiple
 power plant databases.
 """
 
+from importlib import import_module
 from importlib.metadata import version
 
-from . import core, data, heuristics, plot, utils
 from .accessor import PowerPlantAccessor
-from .collection import powerplants
 from .core import get_config, package_config
 
 __author__ = "Fabian Hofmann"
@@ -37,3 +36,20 @@ __all__ = [
     "plot",
     "utils",
 ]
+
+# submodules and functions which are imported on first access, such that
+# importing the package does not load the data sources and plotting libraries
+_lazy_submodules = {"core", "data", "heuristics", "plot", "utils"}
+_lazy_attributes = {"powerplants": "collection"}
+
+
+def __getattr__(name):
+    if name in _lazy_submodules:
+        return import_module(f".{name}", __name__)
+    if name in _lazy_attributes:
+        return getattr(import_module(f".{_lazy_attributes[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -2,9 +2,31 @@
 #
 # SPDX-License-Identifier: MIT
 
+from importlib import import_module
+
 import pandas
 
 
+class _Method:
+    """
+    Function of a submodule used as method of the accessor. The submodule is
+    imported on the first access, such that registering the accessor does not
+    import the whole package.
+    """
+
+    def __init__(self, module, name=None):
+        self.module = module
+        self.name = name
+
+    def __set_name__(self, owner, name):
+        if self.name is None:
+            self.name = name
+
+    def __get__(self, obj, objtype=None):
+        func = getattr(import_module(self.module, __package__), self.name)
+        return func if obj is None else func.__get__(obj, objtype)
+
+
 @pandas.api.extensions.register_dataframe_accessor("powerplant")
 class PowerPlantAccessor:
     """
@@ -27,32 +49,31 @@ class PowerPlantAccessor:
     def __init__(self, pandas_obj):
         self._obj = pandas_obj
 
-    from .cleaning import aggregate_units, clean_powerplantname
-    from .export import map_bus, map_country_bus, to_pypsa_names
-    from .heuristics import (
-        extend_by_non_matched,
-        extend_by_VRE,
-        fill_missing_commissioning_years,
-        fill_missing_commyears,
-        fill_missing_decommissioning_years,
-        fill_missing_decommyears,
-        fill_missing_duration,
-        isin,
-        rescale_capacities_to_country_totals,
-        scale_to_net_capacities,
-    )
-    from .matching import reduce_matched_dataframe
-    from .plot import powerplant_map as plot_map
-    from .utils import (
-        breakdown_matches,
-        convert_alpha2_to_country,
-        convert_country_to_alpha2,
-        convert_to_short_name,
-        fill_geoposition,
-        lookup,
-        select_by_projectID,
-        set_uncommon_fueltypes_to_other,
-    )
+    aggregate_units = _Method(".cleaning")
+    clean_powerplantname = _Method(".cleaning")
+    map_bus = _Method(".export")
+    map_country_bus = _Method(".export")
+    to_pypsa_names = _Method(".export")
+    extend_by_non_matched = _Method(".heuristics")
+    extend_by_VRE = _Method(".heuristics")
+    fill_missing_commissioning_years = _Method(".heuristics")
+    fill_missing_commyears = _Method(".heuristics")
+    fill_missing_decommissioning_years = _Method(".heuristics")
+    fill_missing_decommyears = _Method(".heuristics")
+    fill_missing_duration = _Method(".heuristics")
+    isin = _Method(".heuristics")
+    rescale_capacities_to_country_totals = _Method(".heuristics")
+    scale_to_net_capacities = _Method(".heuristics")
+    reduce_matched_dataframe = _Method(".matching")
+    plot_map = _Method(".plot", "powerplant_map")
+    breakdown_matches = _Method(".utils")
+    convert_alpha2_to_country = _Method(".utils")
+    convert_country_to_alpha2 = _Method(".utils")
+    convert_to_short_name = _Method(".utils")
+    fill_geoposition = _Method(".utils")
+    lookup = _Method(".utils")
+    select_by_projectID = _Method(".utils")
+    set_uncommon_fueltypes_to_other = _Method(".utils")
 
     def plot_aggregated(self, by=["Country", "Fueltype"], figsize=(12, 20), **kwargs):
         """
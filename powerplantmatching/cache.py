@@ -0,0 +1,333 @@
+# SPDX-FileCopyrightText: Contributors to powerplantmatching <https://github.com/pypsa/powerplantmatching>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Content-addressed on-disk caches of intermediate results
+"""
+
+import functools
+import inspect
+import json
+import logging
+import os
+from glob import glob
+from hashlib import sha1
+
+import numpy as np
+import pandas as pd
+
+from .core import _data_in, _data_out, get_config, package_config
+
+logger = logging.getLogger(__name__)
+
+METADATA_KEY = b"powerplantmatching"
+
+
+def _hashable(x):
+    if isinstance(x, (set, frozenset)):
+        return repr(sorted({str(v) for v in _set_to_list(x)}))
+    if isinstance(x, dict):
+        return repr(sorted((str(k), str(v)) for k, v in x.items()))
+    return x
+
+
+def hash_frame(df):
+    """
+    Return a hash of the content of a dataframe, including its index, column
+    names and dtypes.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    """
+    h = sha1()
+    h.update(repr(list(df.columns)).encode())
+    h.update(repr([str(d) for d in df.dtypes]).encode())
+    h.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+    for col in range(df.shape[1]):
+        ds = df.iloc[:, col]
+        try:
+            hashed = pd.util.hash_pandas_object(ds, index=False)
+        except TypeError:
+            hashed = pd.util.hash_pandas_object(ds.map(_hashable), index=False)
+        h.update(hashed.to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def row_hashes(df, key="projectID"):
+    """
+    Return a hash of the content of every row of a dataframe, indexed by the
+    values of the column `key`. Repeated keys are numbered in order of
+    appearance, e.g. "A", "A#1", "A#2".
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    key : str, default "projectID"
+    """
+    content = df.drop(columns=key)
+    try:
+        hashed = pd.util.hash_pandas_object(content, index=False)
+    except TypeError:
+        hashed = pd.util.hash_pandas_object(content.map(_hashable), index=False)
+    keys = df[key].map(_hashable).astype(str)
+    n = keys.groupby(keys).cumcount()
+    keys = keys.where(n == 0, keys + "#" + n.astype(str))
+    return pd.Series(hashed.to_numpy(), index=pd.Index(keys, name=key))
+
+
+def changeset(old, new, key="projectID"):
+    """
+    Compare two versions of a dataset row by row.
+
+    Parameters
+    ----------
+    old, new : pandas.DataFrame or pandas.Series
+        The two versions of the dataset, or their row hashes as returned by
+        `row_hashes`.
+    key : str, default "projectID"
+        Column identifying the rows in both versions.
+
+    Returns
+    -------
+    dict
+        Keys of the "added", "removed" and "changed" rows.
+    """
+    old, new = (
+        x if isinstance(x, pd.Series) else row_hashes(x, key) for x in (old, new)
+    )
+    common = old.index.intersection(new.index)
+    changed = old[common].to_numpy() != new[common].to_numpy()
+    return {
+        "added": new.index.difference(old.index),
+        "removed": old.index.difference(new.index),
+        "changed": common[changed],
+    }
+
+
+def hash_file(fn):
+    """
+    Return a hash of the content of a file.
+    """
+    h = sha1()
+    with open(fn, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_objects(*objs):
+    """
+    Return a hash of json-serializable objects, e.g. config entries or
+    keyword arguments. Dictionaries are hashed independent of their order.
+    """
+    dump = json.dumps(objs, sort_keys=True, default=repr)
+    return sha1(dump.encode()).hexdigest()
+
+
+def cache_file(kind, name, key, config):
+    """
+    Return the path (without extension) of the cache entry `name` with
+    content key `key` in the output subdirectory `kind` of the config,
+    e.g. "matches" or "aggregations".
+    """
+    return _data_out(os.path.join(kind, f"{name}_{key[:16]}"), config)
+
+
+def _set_to_list(x):
+    # missing values are stored as None, the nan objects of a set are thus
+    # restored as a single np.nan
+    return [None if v is None or v != v else v for v in x]
+
+
+def _set_columns(df):
+    return [
+        c
+        for c in df.columns
+        if df[c].dtype == object
+        and df[c].map(lambda x: isinstance(x, (set, frozenset))).any()
+    ]
+
+
+def write_cache(df, fn):
+    """
+    Store a dataframe in the columnar Parquet format under `fn`.parquet.
+    Columns of sets are stored as lists. Frames which cannot be represented
+    in Parquet, e.g. due to columns of mixed types, are pickled to `fn`.pkl.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+    sets = _set_columns(df)
+    converted = df.assign(
+        **{
+            c: df[c].map(
+                lambda x: _set_to_list(x) if isinstance(x, (set, frozenset)) else x
+            )
+            for c in sets
+        }
+    )
+    try:
+        table = pa.Table.from_pandas(converted)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        logger.debug(f"Falling back to pickle for cache file {fn}")
+        df.to_pickle(fn + ".pkl.tmp")
+        os.replace(fn + ".pkl.tmp", fn + ".pkl")
+        return
+    metadata = {**table.schema.metadata, METADATA_KEY: json.dumps({"sets": sets})}
+    pq.write_table(table.replace_schema_metadata(metadata), fn + ".parquet.tmp")
+    os.replace(fn + ".parquet.tmp", fn + ".parquet")
+
+
+def read_cache(fn):
+    """
+    Read a dataframe stored with `write_cache`. Returns None if there is no
+    cache entry under `fn`.
+    """
+    if os.path.exists(fn + ".parquet"):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(fn + ".parquet")
+        meta = json.loads((table.schema.metadata or {}).get(METADATA_KEY, b"{}"))
+        df = table.to_pandas()
+        for c in meta.get("sets", []):
+            df[c] = df[c].map(
+                lambda x: (
+                    {np.nan if v is None else v for v in x}
+                    if isinstance(x, (list, np.ndarray))
+                    else x
+                )
+            )
+        return df
+    if os.path.exists(fn + ".pkl"):
+        return pd.read_pickle(fn + ".pkl")
+    return None
+
+
+class TrackedConfig(dict):
+    """
+    Configuration dictionary which records the keys read from it. Copies of
+    a tracked configuration, e.g. passed to nested loaders, record into the
+    same set.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.accessed = getattr(config, "accessed", set())
+
+    def __getitem__(self, key):
+        self.accessed.add(key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self.accessed.add(key)
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        self.accessed.add(key)
+        return super().get(key, default)
+
+
+@functools.cache
+def code_version():
+    """
+    Return a hash of the source code of the package and of the files in its
+    package data read by the loaders (e.g. the country codes or manual
+    corrections), which invalidates the cached processed data sources
+    whenever the package changes.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    files = sorted(glob(os.path.join(directory, "*.py")))
+    files += sorted(
+        fn
+        for fn in glob(os.path.join(directory, "package_data", "*"))
+        if os.path.isfile(fn)
+    )
+    return hash_objects(*map(hash_file, files))
+
+
+def _raw_file_hashes(config, keys, known):
+    # the raw files of the data sources are given by the "fn" entries of the
+    # read config sections, files with unchanged size and modification time
+    # are not hashed again
+    hashes = {}
+    for key in keys:
+        section = config.get(key)
+        if not isinstance(section, dict) or "fn" not in section:
+            continue
+        path = _data_in(section["fn"])
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        size, mtime = known.get(path, [None, None, None])[:2]
+        if (size, mtime) == (stat.st_size, stat.st_mtime_ns):
+            hashes[path] = known[path]
+        else:
+            hashes[path] = [stat.st_size, stat.st_mtime_ns, hash_file(path)]
+    return hashes
+
+
+def cached_loader(loader):
+    """
+    Decorator caching the processed output of a data loader in
+    `powerplantmatching.data` as Parquet if `cache_sources` is set in the
+    config.
+
+    The output is keyed on the arguments of the loader, the source code of
+    the package, the entries of the config read by the loader and the
+    content of the raw files referenced by these entries (their "fn"). The
+    read config entries are recorded on the first call. Calls with
+    `raw=True` are not cached, calls with `update=True` always process the
+    (downloaded) raw data again.
+    """
+    signature = inspect.signature(loader)
+
+    @functools.wraps(loader)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+        config = arguments.get("config")
+        if config is None:
+            config = get_config()
+        if arguments.get("raw", False) or not config.get("cache_sources", False):
+            return loader(*args, **kwargs)
+
+        name = loader.__name__
+        other = {k: v for k, v in arguments.items() if k not in ["config", "update"]}
+        base = hash_objects(name, code_version(), other)
+        directory = os.path.join(str(package_config["data_dir"]), "processed")
+        manifest = os.path.join(directory, f"{name}_{base[:16]}.json")
+
+        if os.path.exists(manifest) and not arguments.get("update", False):
+            with open(manifest, encoding="utf-8") as f:
+                recorded = json.load(f)
+            keys = recorded["config"]
+            files = _raw_file_hashes(config, keys, recorded["files"])
+            if files is not None:
+                values = {k: config.get(k) for k in keys}
+                key = hash_objects(base, values, [h[2] for h in files.values()])
+                df = read_cache(os.path.join(directory, f"{name}_{key[:16]}"))
+                if df is not None:
+                    logger.debug(f"Reusing processed data source '{name}'.")
+                    return df
+
+        tracked = TrackedConfig(config)
+        arguments["config"] = tracked
+        df = loader(*bound.args, **bound.kwargs)
+
+        keys = sorted(map(str, tracked.accessed))
+        files = _raw_file_hashes(config, keys, {})
+        if files is None:
+            return df
+        values = {k: config.get(k) for k in keys}
+        key = hash_objects(base, values, [h[2] for h in files.values()])
+        write_cache(df, os.path.join(directory, f"{name}_{key[:16]}"))
+        with open(manifest + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"config": keys, "files": files}, f)
+        os.replace(manifest + ".tmp", manifest)
+        return df
+
+    return wrapper
@@ -12,11 +12,14 @@ import logging
 import networkx as nx
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 import unidecode
 from deprecation import deprecated
+from scipy.sparse.csgraph import connected_components
 
-from .core import PANDAS_V3, get_config, get_obj_if_Acc
+from .core import PANDAS_V3, _package_data, get_config, get_obj_if_Acc
 from .duke import duke
+from .native import duke_columns, read_duke_config, self_scores
 from .utils import get_name, set_column_name
 
 logger = logging.getLogger(__name__)
@@ -397,13 +400,15 @@ def clean_technology(df, generalize_hydros=False):
     return df.assign(Technology=tech)
 
 
-def cliques(df, dataduplicates):
+def cliques(df, dataduplicates, grouping="cliques"):
     """
     Locate cliques of units which are determined to belong to the same
     powerplant.  Return the same dataframe with an additional column
     "grouped" which indicates the group that the powerplant is
     belonging to.
 
+    Only reciprocal links are considered.
+
     Parameters
     ----------
     df : pandas.Dataframe or string
@@ -411,18 +416,78 @@ def cliques(df, dataduplicates):
     dataduplicates : pandas.Dataframe or string
         dataframe or name of the csv-linkfile which determines the
         link within one dataset
+    grouping : str, default "cliques"
+        "cliques" groups units which are all linked with each other (units
+        in several maximal cliques are assigned to the last one found),
+        "components" groups all units which are connected by links, i.e.
+        the grouping is transitive.
     """
     #    df = read_csv_if_string(df)
+    if grouping not in ("cliques", "components"):
+        raise ValueError(f"Unknown grouping {grouping!r}")
+
+    if grouping == "components":
+        n = len(df)
+        i = df.index.get_indexer(dataduplicates.iloc[:, 0])
+        j = df.index.get_indexer(dataduplicates.iloc[:, 1])
+        valid = (i >= 0) & (j >= 0) & (i != j)
+        directed = sp.csr_matrix((np.ones(valid.sum()), (i[valid], j[valid])), (n, n))
+        adjacency = directed.astype(bool).multiply(directed.T.astype(bool))
+        _, component = connected_components(adjacency, directed=False)
+        return df.assign(grouped=component)
+
     G = nx.DiGraph()
     G.add_nodes_from(df.index)
-    G.add_edges_from((r.one, r.two) for r in dataduplicates.itertuples())
+    G.add_edges_from(zip(dataduplicates.iloc[:, 0], dataduplicates.iloc[:, 1]))
     H = G.to_undirected(reciprocal=True)
 
-    grouped = pd.Series(np.nan, index=df.index)
-    for i, inds in enumerate(nx.algorithms.clique.find_cliques(H)):
-        grouped.loc[inds] = i
+    # the cliques are numbered in the order networkx finds them, units in
+    # several cliques keep the last one; assigned at once instead of per clique
+    found = list(nx.algorithms.clique.find_cliques(H))
+    grouped = pd.Series(
+        np.repeat(np.arange(len(found), dtype=float), [len(c) for c in found]),
+        index=[n for c in found for n in c],
+    )
+    grouped = grouped[~grouped.index.duplicated(keep="last")]
+
+    return df.assign(grouped=grouped.reindex(df.index))
+
+
+def exact_duplicates(df, blocking=None, duke_config=None):
+    """
+    Locate units with identical values in all columns compared by the duke
+    deduplication. Such units are linked with each other and have the same
+    links to all other units, therefore they always end up in the same group
+    and only one of them needs to be passed to duke.
+
+    Parameters
+    ----------
+    df : pandas.Dataframe
+    blocking : str or list, default None
+        Additional columns which have to be identical.
+    duke_config : str, default None
+        Path to the duke xml file, defaults to the package configuration of
+        the deduplication.
+
+    Returns
+    -------
+    pandas.Series
+        Index label of the representative unit for every unit.
+    """
+    if duke_config is None:
+        duke_config = _package_data("Deleteduplicates.xml")
+    columns = duke_columns(duke_config)
+    if blocking is not None:
+        columns += [c for c in np.atleast_1d(blocking) if c not in columns]
+
+    key = df.groupby(columns, dropna=False, sort=False).ngroup().to_numpy()
+    first = pd.Series(np.arange(len(df))).groupby(key).transform("first").to_numpy()
+    representative = df.index.to_numpy()[first]
 
-    return df.assign(grouped=grouped)
+    # identical units without a match with each other are kept apart
+    threshold = read_duke_config(duke_config)["threshold"]
+    linked = self_scores(df, duke_config).to_numpy()[first] > threshold
+    return pd.Series(np.where(linked, representative, df.index), index=df.index)
 
 
 def aggregate_units(
@@ -486,7 +551,7 @@ def aggregate_units(
         **df[str_cols].fillna("").astype(str),
     )
     if pre_clean_name:
-        df = clean_name(df)
+        df = clean_name(df, config=config)
 
     logger.info(f"Aggregating blocks in data source '{ds_name}'.")
     agg_query = None
@@ -500,18 +565,44 @@ def aggregate_units(
     if with_blocks := config["clean_name"].get("fuel_type_with_blocks", []):  # noqa
         block_query = "Fueltype in @with_blocks"
 
-    if country_wise:
-        countries = df.Country.unique()
-        country_query = "Country == @c"
-        query = " and ".join(filter(None, [agg_query, block_query, country_query]))
-        duplicates = pd.concat(
-            [duke(df.query(query), threads=threads) for c in countries]
-        )
-    else:
-        query = " and ".join(filter(None, [agg_query, block_query]))
-        duplicates = duke(df.query(query) if query else df, threads=threads)
+    query = " and ".join(filter(None, [agg_query, block_query]))
+    blocking = "Country" if country_wise else None
+    subset = df.query(query) if query else df
 
-    df = cliques(df, duplicates)
+    # only one of the units with identical values is passed to duke, the
+    # links of the others are restored from the ones of their representative
+    if config.get("collapse_exact_duplicates", False):
+        representative = exact_duplicates(subset, blocking)
+    else:
+        representative = pd.Series(subset.index, index=subset.index)
+    collapsed = representative.index != representative.to_numpy()
+    logger.debug(f"Collapsed {collapsed.sum()} units with identical values.")
+    duplicates = duke(
+        subset[~collapsed],
+        threads=threads,
+        blocking=blocking,
+        config=config,
+    )
+    if country_wise:
+        # the links are ordered by country as in a run per country, the
+        # order of the links determines the order of the cliques found
+        rank = pd.Series(range(df.Country.nunique()), index=df.Country.unique())
+        country = subset.Country.reindex(duplicates.iloc[:, 0]).map(rank)
+        duplicates = duplicates.iloc[np.argsort(country.to_numpy(), kind="stable")]
+    if collapsed.any():
+        members = representative[representative.isin(representative[collapsed])]
+        members = members.rename("rep").rename_axis("unit").reset_index()
+        links = duplicates.set_axis(["one", "two"], axis=1)
+        for label in ["one", "two"]:
+            links = links.merge(members, how="left", left_on=label, right_on="rep")
+            links[label] = links.unit.combine_first(links[label])
+            links = links.drop(columns=["rep", "unit"])
+        within = members.merge(members, on="rep").query("unit_x != unit_y")
+        within = within[["unit_x", "unit_y"]].set_axis(["one", "two"], axis=1)
+        duplicates = pd.concat([links, within], ignore_index=True)
+
+    grouping = (config.get(ds_name) or {}).get("grouping", "cliques")
+    df = cliques(df, duplicates, grouping=grouping)
     df = df.groupby("grouped").agg(props_for_groups)
 
     no_downcast_ctx = (
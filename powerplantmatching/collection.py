@@ -12,13 +12,25 @@ import os
 import pandas as pd
 from deprecation import deprecated
 
+from .cache import (
+    cache_file,
+    changeset,
+    hash_file,
+    hash_frame,
+    hash_objects,
+    read_cache,
+    row_hashes,
+    write_cache,
+)
 from .cleaning import aggregate_units
-from .core import _data_out, get_config
+from .core import _data_out, _package_data, get_config
+from .download import download
 from .heuristics import extend_by_non_matched, extend_by_VRE
 from .matching import combine_multiple_datasets, reduce_matched_dataframe
 from .utils import (
     parmap,
     parse_string_to_dict,
+    retrieve_raw_files,
     set_column_name,
     to_dict_if_string,
 )
@@ -26,11 +38,36 @@ from .utils import (
 logger = logging.getLogger(__name__)
 
 
+def _log_changes(name, df, config):
+    """
+    Log the number of added, removed and changed rows of a data source since
+    the last collection, identified by the projectID and a hash of the row
+    content, see `powerplantmatching.cache.changeset`. The log is informative
+    only, the cached aggregations and matches are keyed by the content of
+    each country.
+    """
+    fn = _data_out(os.path.join("sources", f"{name}_rows"), config)
+    hashes = row_hashes(df).rename("hash")
+    previous = read_cache(fn)
+    if previous is None:
+        write_cache(hashes.to_frame(), fn)
+        return
+    changes = changeset(previous["hash"], hashes)
+    if any(len(keys) for keys in changes.values()):
+        logger.info(
+            f"Data source '{name}' changed since the last collection: "
+            + ", ".join(f"{len(keys)} {kind}" for kind, keys in changes.items())
+            + " rows."
+        )
+        write_cache(hashes.to_frame(), fn)
+
+
 def collect(
     datasets,
     update=False,
     reduced=True,
     config=None,
+    changed=None,
     **dukeargs,
 ):
     """
@@ -47,6 +84,9 @@ def collect(
         Switch as to return the reduced (True) or matched (False) dataset.
     config : dict
         Configuration file of powerplantmatching
+    changed : list, optional
+        Datasets which changed since the last update, only their comparisons
+        are run again while the other matches are read from the cache.
     **dukeargs : keyword-args for duke
     """
 
@@ -60,15 +100,64 @@ def collect(
         get_df = getattr(data, name)
         df = get_df(config=config)
 
+        query = None
         for source in config["matching_sources"]:
             if isinstance(source, dict) and next(iter(source)) == name:
-                df = df.query(source[name])
+                query = source[name]
+                df = df.query(query)
 
-        if not conf.get("aggregated_units", False):
-            return aggregate_units(df, dataset_name=name, config=config)
-        else:
+        if config.get("cache_aggregations", False):
+            _log_changes(name, df, config)
+
+        if conf.get("aggregated_units", False):
             return df.assign(projectID=df.projectID.map(lambda x: {x}))
 
+        if df.empty or not config.get("cache_aggregations", False):
+            return aggregate_units(df, dataset_name=name, config=config)
+
+        # units are only aggregated within a country, the aggregation of each
+        # country is cached separately such that updates of a data source
+        # only aggregate the countries with changed units again
+        key = hash_objects(
+            query,
+            config["clean_name"],
+            name in config.get("aggregate_only_matching_sources", []),
+            config["target_columns"],
+            hash_file(_package_data("Deleteduplicates.xml")),
+            config.get("duke_engine", "java"),
+            config.get("native_candidates"),
+            config.get("collapse_exact_duplicates", False),
+        )
+        countries = df.Country.fillna("")
+        blocks = {
+            country: block for country, block in df.groupby(countries, sort=False)
+        }
+        files = {
+            country: cache_file(
+                "aggregations",
+                f"{name}_{country}",
+                hash_objects(key, hash_frame(block.reset_index(drop=True))),
+                config,
+            )
+            for country, block in blocks.items()
+        }
+        aggregated = {country: read_cache(fn) for country, fn in files.items()}
+        todo = [c for c, agg in aggregated.items() if agg is None]
+        if len(todo) < len(blocks):
+            logger.info(
+                f"Reusing cached aggregation of {len(blocks) - len(todo)} of "
+                f"{len(blocks)} countries of data source '{name}'."
+            )
+        if todo:
+            new = aggregate_units(
+                pd.concat([blocks[c] for c in todo]), dataset_name=name, config=config
+            )
+            for country, block in new.groupby(new.Country.fillna(""), sort=False):
+                aggregated[country] = block
+                write_cache(block, files[country])
+        aggregated = [a for a in aggregated.values() if a is not None]
+        return pd.concat(aggregated, ignore_index=True).pipe(set_column_name, name)
+
     # Deal with the case that only one dataset is requested
     if isinstance(datasets, str):
         return df_by_name(datasets)
@@ -88,7 +177,9 @@ def collect(
 
     if update:
         dfs = parmap(df_by_name, datasets)
-        matched = combine_multiple_datasets(dfs, datasets, config=config, **dukeargs)
+        matched = combine_multiple_datasets(
+            dfs, datasets, config=config, changed=changed, **dukeargs
+        )
         (
             matched.assign(projectID=lambda df: df.projectID.astype(str)).to_csv(
                 outfn_matched, index_label="id"
@@ -162,7 +253,7 @@ def powerplants(
             Arguments passed to powerplantmatching.collection.Collection.
 
     """
-    from . import latest_release
+    from . import data, latest_release
 
     if config is None:
         if config_update is None:
@@ -194,15 +285,13 @@ def powerplants(
     if from_url:
         fn = _data_out("matched_data_red.csv", config)
         url = config["matched_data_url"].format(tag="v" + latest_release)
-        logger.info(f"Retrieving data from {url}")
-        df = (
-            pd.read_csv(url, index_col=0)
+        logger.info(f"Store data at {fn}")
+        download(url, fn, update=True)
+        return (
+            pd.read_csv(fn, index_col=0)
             .pipe(parse_string_to_dict, ["projectID", "EIC"])
             .pipe(set_column_name, "Matched Data")
         )
-        logger.info(f"Store data at {fn}")
-        df.to_csv(fn)
-        return df
 
     if not update and os.path.exists(fn):
         df = (
@@ -219,6 +308,22 @@ def powerplants(
     matching_sources = [
         list(to_dict_if_string(a))[0] for a in config["matching_sources"]
     ]
+    # retrieve the missing raw files of all sources of the build in parallel
+    sources = list(matching_sources)
+    if isinstance(config["fully_included_sources"], list):
+        sources += [
+            list(to_dict_if_string(a))[0] for a in config["fully_included_sources"]
+        ]
+    if extend_by_vres:
+        sources.append("OPSD_VRE")
+    retrieve_raw_files(
+        [
+            f
+            for name in dict.fromkeys(sources)
+            for f in data.RAW_FILES.get(name, [name])
+        ],
+        config=config,
+    )
     matched = collect(matching_sources, config=config, **collection_kwargs)
 
     if isinstance(config["fully_included_sources"], list):
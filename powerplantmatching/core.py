@@ -64,7 +64,10 @@ logger.setLevel(logging.INFO)
 logFormatter = logging.Formatter(
     "%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s"
 )
-fileHandler = logging.FileHandler(join(str(package_config["data_dir"]), "PPM.log"))
+# the log file is only opened on the first record
+fileHandler = logging.FileHandler(
+    join(str(package_config["data_dir"]), "PPM.log"), delay=True
+)
 fileHandler.setFormatter(logFormatter)
 logger.addHandler(fileHandler)
 # logger.info('Initialization complete.')
@@ -12,13 +12,13 @@ import logging
 import os
 from zipfile import ZipFile
 
-import entsoe
 import numpy as np
 import pandas as pd
 import pycountry
 import requests
 from deprecation import deprecated
 
+from .cache import cached_loader
 from .cleaning import (
     clean_name,
     gather_fueltype_info,
@@ -32,14 +32,32 @@ from .utils import (
     convert_to_short_name,
     correct_manually,
     get_raw_file,
+    read_csv_chunked,
+    read_excel_sheets,
     set_column_name,
 )
 
 logger = logging.getLogger(__name__)
 cget = pycountry.countries.get
-net_caps = get_config()["display_net_caps"]
 
+# raw file configurations read by the data sources, if they differ from the
+# name of the data source, used to retrieve the files of a build in parallel
+RAW_FILES = {
+    "ENTSOE": [],  # retrieved from the ENTSO-E API if a token is given
+    "GEM": ["GBPT", "GGPT", "GCPT", "GGTPT", "GNPT", "GSPT", "GWPT", "GHPT"],
+    "GEO": ["GEO", "GEO_units"],
+    "OPSD": ["OPSD_DE", "OPSD_EU"],
+}
 
+
+def __getattr__(name):
+    # the config is only read when the module attribute is requested
+    if name == "net_caps":
+        return get_config()["display_net_caps"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@cached_loader
 def BEYONDCOAL(raw=False, update=False, config=None):
     """
     Importer for the BEYOND COAL database.
@@ -59,17 +77,17 @@ def BEYONDCOAL(raw=False, update=False, config=None):
     config = get_config() if config is None else config
 
     fn = get_raw_file("BEYONDCOAL", update=update, config=config)
-    df = pd.read_excel(
-        fn, sheet_name="Unit", header=0, skiprows=[0, 2, 3], na_values=["unknown"]
-    )
-
-    df_plant = pd.read_excel(
+    sheets = read_excel_sheets(
         fn,
-        sheet_name="Plant",
+        {
+            "Unit": dict(na_values=["unknown"]),
+            "Plant": dict(usecols=["BFF plant ID", "Latitude", "Longitude"]),
+        },
         header=0,
         skiprows=[0, 2, 3],
-        usecols=["BFF plant ID", "Latitude", "Longitude"],
-    ).set_index("BFF plant ID")
+    )
+    df = sheets["Unit"]
+    df_plant = sheets["Plant"].set_index("BFF plant ID")
 
     df["lat"] = df["BFF plant ID"].map(df_plant.Latitude)
     df["lon"] = df["BFF plant ID"].map(df_plant.Longitude)
@@ -118,7 +136,7 @@ def BEYONDCOAL(raw=False, update=False, config=None):
             Set=lambda df: df["Unit type"].map(SET_MAP),
             Technology=np.nan,
         )
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(convert_to_short_name)
         .pipe(set_column_name, "BEYONDCOAL")
         .pipe(config_filter, config)
@@ -127,6 +145,7 @@ def BEYONDCOAL(raw=False, update=False, config=None):
     return df_final
 
 
+@cached_loader
 def OPSD(
     raw=False,
     update=False,
@@ -233,7 +252,7 @@ def OPSD(
             regex=True,
         )
         .pipe(gather_specifications, config=config)
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .dropna(subset=["Capacity"])
         .powerplant.convert_alpha2_to_country()
         # .pipe(fill_geoposition, **fill_geoposition_kwargs)
@@ -246,6 +265,7 @@ def OPSD(
 #     deprecated_in="0.8.0",
 #     details="Deprecated since data is not maintained. Use GEM instead.",
 # )
+@cached_loader
 def GEO(raw=False, update=False, config=None):
     """
     Importer for the GEO database.
@@ -313,8 +333,8 @@ def GEO(raw=False, update=False, config=None):
         "FuelClassification1",
         "FuelClassification2",
     ]
-    ppl = gather_specifications(ppl, parse_columns=cols)
-    ppl = clean_name(ppl)
+    ppl = gather_specifications(ppl, parse_columns=cols, config=config)
+    ppl = clean_name(ppl, config=config)
 
     res = units.join(ppl.set_index("projectID"), "projectID", rsuffix="_ppl")
     res["DateIn"] = res.DateIn.fillna(res.DateIn_ppl)
@@ -336,6 +356,7 @@ def GEO(raw=False, update=False, config=None):
     deprecated_in="0.5.0",
     details="Removed since data is not publicly available anymore",
 )
+@cached_loader
 def CARMA(raw=False, update=False, config=None):
     """
     Importer for the Carma database.
@@ -394,7 +415,7 @@ def CARMA(raw=False, update=False, config=None):
             )
         )
         .pipe(gather_specifications, config=config)
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(set_column_name, "CARMA")
         .drop_duplicates()
         .pipe(config_filter, config)
@@ -402,6 +423,7 @@ def CARMA(raw=False, update=False, config=None):
     )
 
 
+@cached_loader
 def JRC(raw=False, update=False, config=None):
     """
     Importer for the JRC Hydro-power plants database retrieves from
@@ -475,7 +497,7 @@ def JRC(raw=False, update=False, config=None):
         )
         .drop(columns=["pypsa_id", "GEO"])
         .powerplant.convert_alpha2_to_country()
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(set_large_spanish_stores_to_reservoirs)
         .pipe(set_column_name, "JRC")
         .pipe(config_filter, config)
@@ -510,11 +532,12 @@ def IWPDCY(config=None):
         .dropna(subset=["Capacity"])
         .pipe(set_column_name, "IWPDCY")
         .pipe(config_filter, config)
-        .pipe(gather_set_info)
+        .pipe(gather_set_info, config=config)
         .pipe(correct_manually, "IWPDCY", config=config)
     )
 
 
+@cached_loader
 def Capacity_stats(
     raw=False,
     config=None,
@@ -566,6 +589,7 @@ def Capacity_stats(
     return df
 
 
+@cached_loader
 def GPD(raw=False, update=False, config=None, filter_other_dbs=True):
     """
     Importer for the `Global Power Plant Database`.
@@ -618,7 +642,7 @@ def GPD(raw=False, update=False, config=None, filter_other_dbs=True):
             parse_columns=["Name", "Fueltype"],
             config=config,
         )
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(set_column_name, "GPD")
         .pipe(config_filter, config)
         .pipe(gather_specifications, config=config)
@@ -629,6 +653,7 @@ def GPD(raw=False, update=False, config=None, filter_other_dbs=True):
 #     deprecated_in="0.8.0",
 #     details="Removed since data is not maintained. Use GNPT instead.",
 # )
+@cached_loader
 def WIKIPEDIA(raw=False, update=False, config=None):
     """
     Importer for the WIKIPEDIA nuclear power plant database.
@@ -670,13 +695,14 @@ def WIKIPEDIA(raw=False, update=False, config=None):
             # plants which are not yet built are set to 2027
             DateIn=lambda df: df.DateIn.where(~df.Status.str.contains("In Bau"), 2027),
         )
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(set_column_name, "WIKIPEDIA")
         .pipe(config_filter, config)
     )
     return df
 
 
+@cached_loader
 def ENTSOE(
     raw=False,
     update=False,
@@ -720,6 +746,8 @@ def ENTSOE(
     web%20api/Guide.html#_authentication_and_authorisation. Please save the
     token in your config.yaml file (key 'entsoe_token').
     """
+    import entsoe
+
     config = get_config() if config is None else config
 
     def retrieve_data(token):
@@ -797,12 +825,13 @@ def ENTSOE(
         # .pipe(fill_geoposition, **fill_geoposition_kwargs)
         .query("Capacity > 0")
         .pipe(gather_specifications, config=config)
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(set_column_name, "ENTSOE")
         .pipe(config_filter, config)
     )
 
 
+@cached_loader
 def ENTSOE_EIC(raw=False, update=False, config=None, entsoe_token=None):
     """
     Importer for the meta data given for each ENTSOE entry.
@@ -857,6 +886,7 @@ def ENTSOE_EIC(raw=False, update=False, config=None, entsoe_token=None):
     )
 
 
+@cached_loader
 def OSM(raw=False, update=False, config=None):
     """
     Importer for the OpenStreetMap power plant data.
@@ -894,7 +924,7 @@ def OSM(raw=False, update=False, config=None):
             parse_columns=["Name", "Fueltype", "Technology", "Set"],
             config=config,
         )
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(set_column_name, "OSM")
         .pipe(config_filter, config)
     )
@@ -1201,6 +1231,7 @@ def WEPP(raw=False, config=None):
     deprecated_in="0.5.0",
     details="This function is not maintained anymore. Use MASTR instead.",
 )
+@cached_loader
 def UBA(
     raw=False,
     update=False,
@@ -1286,7 +1317,7 @@ def UBA(
         Technology=uba.Technology.replace(RENAME_TECHNOLOGY),
     )
     uba.loc[uba.CHP.notnull(), "Set"] = "CHP"
-    uba = uba.pipe(gather_set_info)
+    uba = uba.pipe(gather_set_info, config=config)
     uba.loc[uba.Fueltype == "Wind (O)", "Technology"] = "Offshore"
     uba.loc[uba.Fueltype == "Wind (L)", "Technology"] = "Onshore"
     uba.loc[uba.Fueltype.str.contains("Wind"), "Fueltype"] = "Wind"
@@ -1324,6 +1355,7 @@ def UBA(
     deprecated_in="0.5.0",
     details="This function is not maintained anymore. Use MASTR instead.",
 )
+@cached_loader
 def BNETZA(
     raw=False,
     update=False,
@@ -1490,6 +1522,7 @@ def BNETZA(
 #     deprecated_in="0.8.0",
 #     details="Removed since data is not maintained. Use GSPT, GWPT and GHPT instead.",
 # )
+@cached_loader
 def OPSD_VRE(raw=False, update=False, config=None):
     """
     Importer for the OPSD (Open Power Systems Data) renewables (VRE)
@@ -1543,6 +1576,7 @@ def OPSD_VRE(raw=False, update=False, config=None):
 #     deprecated_in="0.8.0",
 #     details="Removed since data is not maintained. Use GSPT, GWPT and GHPT instead.",
 # )
+@cached_loader
 def OPSD_VRE_country(country, raw=False, update=False, config=None):
     """
     Get country specific data from OPSD for renewables, if available.
@@ -1586,6 +1620,7 @@ def OPSD_VRE_country(country, raw=False, update=False, config=None):
     )
 
 
+@cached_loader
 def IRENASTAT(raw=False, update=False, config=None):
     """
     Importer for the IRENASTAT renewable capacity statistics.
@@ -1675,6 +1710,7 @@ def IRENASTAT(raw=False, update=False, config=None):
     return df
 
 
+@cached_loader
 def GBPT(raw=False, update=False, config=None):
     """
     Importer for the global bioenergy powerplant tracker from global energy monitor.
@@ -1692,18 +1728,12 @@ def GBPT(raw=False, update=False, config=None):
     """
     config = get_config() if config is None else config
     fn = get_raw_file("GBPT", update=update, config=config)
-    try:
-        large = pd.read_excel(fn, sheet_name="Data")
-        small = pd.read_excel(fn, sheet_name="Below Threshold")
-        df = pd.concat([large, small], ignore_index=True)
-    except Exception as e:
-        if "Below Threshold" in e.args[0]:
-            logger.info(
-                "In newer versions of the dataset, the sheet 'Below Threshold' does not exist anymore."
-            )
-            df = pd.read_excel(fn, sheet_name="Data")
-        else:
-            logger.error(e)
+    sheets = read_excel_sheets(fn, ["Data", "Below Threshold"], required=False)
+    if "Below Threshold" not in sheets:
+        logger.info(
+            "In newer versions of the dataset, the sheet 'Below Threshold' does not exist anymore."
+        )
+    df = pd.concat(sheets.values(), ignore_index=True)
 
     if raw:
         return df
@@ -1770,12 +1800,13 @@ def GBPT(raw=False, update=False, config=None):
         .pipe(lambda x: x[df.columns.intersection(config.get("target_columns"))])
         .assign(Technology=np.nan)
         .assign(Set=np.nan)
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(config_filter, config)
     )
     return df_final
 
 
+@cached_loader
 def GNPT(raw=False, update=False, config=None):
     """
     Importer for the global nuclear energy powerplant tracker from global energy monitor.
@@ -1793,7 +1824,7 @@ def GNPT(raw=False, update=False, config=None):
     """
     config = get_config() if config is None else config
     fn = get_raw_file("GNPT", update=update, config=config)
-    df = pd.read_excel(fn, sheet_name="Data", na_values=["--"])
+    df = read_excel_sheets(fn, ["Data"], na_values=["--"])["Data"]
 
     if raw:
         return df
@@ -1831,12 +1862,13 @@ def GNPT(raw=False, update=False, config=None):
         .assign(Fueltype="Nuclear")
         .assign(Technology="Steam Turbine")
         .assign(Set="PP")
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(config_filter, config)
     )
     return df_final
 
 
+@cached_loader
 def GCPT(raw=False, update=False, config=None):
     """
     Importer for the global coal powerplant tracker from global energy monitor.
@@ -1855,7 +1887,7 @@ def GCPT(raw=False, update=False, config=None):
 
     config = get_config() if config is None else config
     fn = get_raw_file("GCPT", update=update, config=config)
-    df = pd.read_excel(fn, sheet_name="Units", na_values=["not found", "-"])
+    df = read_excel_sheets(fn, ["Units"], na_values=["not found", "-"])["Units"]
 
     if raw:
         return df
@@ -1931,13 +1963,14 @@ def GCPT(raw=False, update=False, config=None):
                 {"Fueltype": fueltype_dict, "Technology": technology_dict}
             )
         )
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(config_filter, config)
     )
 
     return df_final
 
 
+@cached_loader
 def GGTPT(raw=False, update=False, config=None):
     """
     Importer for the global geothermal powerplant tracker from global energy monitor.
@@ -1955,7 +1988,7 @@ def GGTPT(raw=False, update=False, config=None):
     """
     config = get_config() if config is None else config
     fn = get_raw_file("GGTPT", update=update, config=config)
-    df = pd.read_excel(fn, sheet_name="Data")
+    df = read_excel_sheets(fn, ["Data"])["Data"]
 
     if raw:
         return df
@@ -1989,12 +2022,13 @@ def GGTPT(raw=False, update=False, config=None):
         .assign(Fueltype="Geothermal")
         .assign(Technology="Steam Turbine")
         .assign(Set="PP")
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(config_filter, config)
     )
     return df_final
 
 
+@cached_loader
 def GWPT(raw=False, update=False, config=None):
     """
     Importer for the global wind powerplant tracker from global energy monitor.
@@ -2012,9 +2046,8 @@ def GWPT(raw=False, update=False, config=None):
     """
     config = get_config() if config is None else config
     fn = get_raw_file("GWPT", update=update, config=config)
-    df = pd.read_excel(fn, sheet_name="Data")
-    df_small = pd.read_excel(fn, sheet_name="Below Threshold")
-    df = pd.concat([df, df_small], ignore_index=True)
+    sheets = read_excel_sheets(fn, ["Data", "Below Threshold"])
+    df = pd.concat(sheets.values(), ignore_index=True)
 
     if raw:
         return df
@@ -2056,12 +2089,13 @@ def GWPT(raw=False, update=False, config=None):
         .pipe(lambda x: x.replace({"Technology": technology_dict}))
         .assign(Fueltype="Wind")
         .assign(Set="PP")
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(config_filter, config)
     )
     return df_final
 
 
+@cached_loader
 def GSPT(raw=False, update=False, config=None):
     """
     Importer for the global solar powerplant tracker from global energy monitor.
@@ -2080,7 +2114,7 @@ def GSPT(raw=False, update=False, config=None):
 
     config = get_config() if config is None else config
     fn = get_raw_file("GSPT", update=update, config=config)
-    df = pd.read_excel(fn, sheet_name="Utility-Scale (1 MW+)")
+    df = read_excel_sheets(fn, ["Utility-Scale (1 MW+)"])["Utility-Scale (1 MW+)"]
 
     if raw:
         return df
@@ -2121,12 +2155,13 @@ def GSPT(raw=False, update=False, config=None):
         .pipe(lambda x: x.replace({"Technology": technology_dict}))
         .assign(Fueltype="Solar")
         .assign(Set="PP")
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(config_filter, config)
     )
     return df_final
 
 
+@cached_loader
 def GGPT(raw=False, update=False, config=None):
     """
     Importer for the global gas powerplant tracker from global energy monitor.
@@ -2144,11 +2179,10 @@ def GGPT(raw=False, update=False, config=None):
     """
     config = get_config() if config is None else config
     fn = get_raw_file("GGPT", update=update, config=config)
-    df = pd.read_excel(fn, sheet_name="Gas & Oil Units", na_values=["not found"])
-    df_small = pd.read_excel(
-        fn, sheet_name="sub-threshold units", na_values=["not found"]
+    sheets = read_excel_sheets(
+        fn, ["Gas & Oil Units", "sub-threshold units"], na_values=["not found"]
     )
-    df = pd.concat([df, df_small], ignore_index=True)
+    df = pd.concat(sheets.values(), ignore_index=True)
 
     if raw:
         return df
@@ -2222,12 +2256,13 @@ def GGPT(raw=False, update=False, config=None):
         .pipe(lambda x: x[df.columns.intersection(config.get("target_columns"))])
         .pipe(lambda x: x.replace({"Technology": technology_dict}))
         .pipe(lambda x: x.replace({"Set": set_dict}))
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(config_filter, config)
     )
     return df_final
 
 
+@cached_loader
 def GHPT(raw=False, update=False, config=None):
     """
     Importer for the global gas powerplant tracker from global energy monitor.
@@ -2245,9 +2280,8 @@ def GHPT(raw=False, update=False, config=None):
     """
     config = get_config() if config is None else config
     fn = get_raw_file("GHPT", update=update, config=config)
-    large = pd.read_excel(fn, sheet_name="Data")
-    small = pd.read_excel(fn, sheet_name="Below Threshold")
-    df = pd.concat([large, small], ignore_index=True)
+    sheets = read_excel_sheets(fn, ["Data", "Below Threshold"])
+    df = pd.concat(sheets.values(), ignore_index=True)
 
     if raw:
         return df
@@ -2288,12 +2322,13 @@ def GHPT(raw=False, update=False, config=None):
         .pipe(lambda x: x.replace({"Technology": technology_dict}))
         .assign(Fueltype="Hydro")
         .assign(Set="PP")
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(config_filter, config)
     )
     return df_final
 
 
+@cached_loader
 def GEM(raw=False, update=False, config=None):
     """
     Get the combined dataset of all GEM (https://globalenergymonitor.org/) datasets.
@@ -2313,6 +2348,7 @@ def GEM(raw=False, update=False, config=None):
     return pd.concat(data, ignore_index=True)
 
 
+@cached_loader
 def MASTR(
     raw=False,
     update=False,
@@ -2339,7 +2375,7 @@ def MASTR(
 
     config = get_config() if config is None else config
 
-    THRESHOLD_KW = config["MASTR"].get("capacity_threshold", 0.1) * 1e3  # noqa: F841
+    THRESHOLD_KW = config["MASTR"].get("capacity_threshold", 0.1) * 1e3
 
     RENAME_COLUMNS = {
         "EinheitMastrNummer": "projectID",
@@ -2370,6 +2406,23 @@ def MASTR(
         "Technologie",
     ]
 
+    # the dtypes are fixed as they are inferred per chunk otherwise
+    FLOAT_COLUMNS = [
+        "Nettonennleistung",
+        "ThermischeNutzleistung",
+        "Laengengrad",
+        "Breitengrad",
+    ]
+
+    status_list = config["MASTR"].get("status", ["In Betrieb"])
+
+    def select(chunk):
+        # the large members (wind, solar) are filtered while streaming
+        chunk = chunk[chunk.Nettonennleistung >= THRESHOLD_KW]
+        if not raw and "EinheitBetriebsstatus" in chunk:
+            chunk = chunk[chunk.EinheitBetriebsstatus.isin(status_list)]
+        return chunk
+
     fn = get_raw_file("MASTR", update=update, config=config)
     file_suffixes = {
         "Bioenergy": "biomass_raw.csv",
@@ -2403,11 +2456,13 @@ def MASTR(
                         target_columns + PARSE_COLUMNS + list(RENAME_COLUMNS.keys())
                     )
                     usecols = available_columns.intersection(target_columns)
-                    df = (
-                        pd.read_csv(file.open(name), usecols=usecols, low_memory=False)
-                        .assign(Filesuffix=fueltype)
-                        .query("Nettonennleistung >= @THRESHOLD_KW")
-                    )
+                    dtype = {c: float if c in FLOAT_COLUMNS else str for c in usecols}
+                    df = read_csv_chunked(
+                        file.open(name),
+                        select=select,
+                        usecols=usecols,
+                        dtype=dtype,
+                    ).assign(Filesuffix=fueltype)
                     data_frames.append(df)
                     break
     df = pd.concat(data_frames).reset_index(drop=True)
@@ -2436,8 +2491,6 @@ def MASTR(
     if raw:
         return df
 
-    status_list = config["MASTR"].get("status", ["In Betrieb"])  # noqa: F841
-
     PLZ_map = PLZ_to_LatLon_map()
     df.Postleitzahl = (
         df.Postleitzahl.astype(str)
@@ -2572,7 +2625,7 @@ def MASTR(
     )
 
     df_final = (
-        df_processed.pipe(clean_name)
+        df_processed.pipe(clean_name, config=config)
         .pipe(set_column_name, "MASTR")
         .pipe(config_filter, config)
     )
@@ -2589,6 +2642,7 @@ def GEM_GGPT(*args, **kwargs):
     return GGPT(*args, **kwargs)
 
 
+@cached_loader
 def EESI(
     raw=False,
     update=False,
@@ -2691,7 +2745,7 @@ def EESI(
     df_processed.Technology = df_processed.Technology.map(TECHNOLOGY_MAPPING)
 
     df_final = (
-        df_processed.pipe(clean_name)
+        df_processed.pipe(clean_name, config=config)
         .pipe(set_column_name, "EESI")
         .pipe(config_filter, config)
     )
@@ -2699,6 +2753,7 @@ def EESI(
     return df_final
 
 
+@cached_loader
 def GND(
     raw=False,
     update=False,
@@ -2751,7 +2806,7 @@ def GND(
             Set="PP",
             Fueltype="Nuclear",
         )
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(set_column_name, "GND")
         .pipe(config_filter, config)
     )
@@ -2759,6 +2814,7 @@ def GND(
     return df_final
 
 
+@cached_loader
 def GHR(
     raw=False,
     update=False,
@@ -2822,7 +2878,7 @@ def GHR(
             Set="PP",
             Fueltype="Hydro",
         )
-        .pipe(clean_name)
+        .pipe(clean_name, config=config)
         .pipe(set_column_name, "GHR")
         .pipe(config_filter, config)
     )
@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: Contributors to powerplantmatching <https://github.com/pypsa/powerplantmatching>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Retrieval of raw data files over HTTP
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import version
+
+from packaging.version import parse
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+
+
+@functools.cache
+def session():
+    """
+    Return the HTTP session shared by all downloads, which keeps the
+    connections to the servers open between requests.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    base_version = parse(version(__package__)).base_version
+    s.headers["User-Agent"] = f"{__package__}/{base_version}"
+    return s
+
+
+def _read_validators(path, url):
+    # the validators of the server response are stored next to the file and
+    # only used if the file was downloaded from the same url and not changed
+    # since, e.g. by writing a locally built dataset to the same path
+    fn = path + ".http.json"
+    if not (os.path.exists(path) and os.path.exists(fn)):
+        return {}
+    with open(fn, encoding="utf-8") as f:
+        validators = json.load(f)
+    stat = os.stat(path)
+    unchanged = validators.get("file") == [stat.st_size, stat.st_mtime_ns]
+    if validators.get("url") != url or not unchanged:
+        return {}
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def _write_validators(path, url, response):
+    fn = path + ".http.json"
+    stat = os.stat(path)
+    validators = {
+        "url": url,
+        "file": [stat.st_size, stat.st_mtime_ns],
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    with open(fn + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(validators, f)
+    os.replace(fn + ".tmp", fn)
+
+
+def download(url, path, update=False, timeout=60):
+    """
+    Download a file, unless it already exists.
+
+    The response is streamed to a temporary file next to `path`, which
+    replaces `path` once the download is complete. The ETag and
+    Last-Modified headers of the response are stored in the sidecar file
+    `path`.http.json, such that updates are only downloaded if the file on
+    the server has changed.
+
+    Parameters
+    ----------
+    url : str
+    path : str
+        Target path of the file.
+    update : bool, default False
+        Whether to download the file again if it exists. The server is asked
+        for the file only if it has changed since the last download.
+    timeout : float, default 60
+        Timeout of the connection and of reading from it in seconds.
+
+    Returns
+    -------
+    path : str
+    """
+    if os.path.exists(path) and not update:
+        return path
+
+    headers = _read_validators(path, url)
+    logger.info(f"Retrieving data from {url}")
+    with session().get(url, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 304:
+            logger.info(f"{os.path.basename(path)} is up to date.")
+            return path
+        r.raise_for_status()
+
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        _write_validators(path, url, r)
+    return path
+
+
+def download_many(files, update=False, max_workers=8, timeout=60):
+    """
+    Download several files in parallel, see `download`.
+
+    Parameters
+    ----------
+    files : dict
+        Mapping of the target paths to the urls.
+    update : bool, default False
+    max_workers : int, default 8
+        Maximal number of parallel downloads.
+    timeout : float, default 60
+
+    Returns
+    -------
+    list
+        The target paths. If a download fails, the error is raised once all
+        other downloads are finished.
+    """
+    if not files:
+        return []
+    with ThreadPoolExecutor(min(max_workers, len(files))) as executor:
+        futures = [
+            executor.submit(download, url, path, update, timeout)
+            for path, url in files.items()
+        ]
+    return [future.result() for future in futures]
@@ -2,20 +2,186 @@
 #
 # SPDX-License-Identifier: MIT
 
+import atexit
+import io
 import logging
 import os
+import queue
+import re
 import shutil
 import subprocess as sub
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
 
-from .core import _package_data
+from .core import _package_data, get_config
+from .native import duke_native, similarities_file
 
 logger = logging.getLogger(__name__)
 
 
+def duke_classpath():
+    """
+    Return the Java classpath including all duke binaries.
+    """
+    duke_bin_dir = _package_data("duke_binaries")
+    return os.pathsep.join(
+        [os.path.join(duke_bin_dir, r) for r in sorted(os.listdir(duke_bin_dir))]
+    )
+
+
+def check_java():
+    try:
+        sub.run(["java", "-version"], check=True, capture_output=True)
+    except (sub.CalledProcessError, FileNotFoundError):
+        err = "Java is not installed or not in the system's PATH. Please install Java and ensure it is in your system's PATH, then try again."
+        logger.error(err)
+        raise FileNotFoundError(err)
+
+
+class DukeWorker:
+    """
+    Long-lived Java process which runs duke for every command sent to it.
+
+    Compared to a new subprocess per duke run, the JVM startup and the class
+    loading is only paid once. If the process dies, it is restarted with the
+    next command.
+
+    Parameters
+    ----------
+    java_options : list, default None
+        Additional options passed to the JVM, e.g. ["-Xmx4g"].
+    """
+
+    def __init__(self, java_options=None):
+        self.java_options = list(java_options or [])
+        self.process = None
+
+    def command(self):
+        """
+        Return the command starting the worker. The class `DukeWorker` is
+        shipped precompiled in the package data, next to its source.
+        """
+        worker_dir = os.path.dirname(_package_data("DukeWorker.class"))
+        classpath = os.pathsep.join([worker_dir, duke_classpath()])
+        args = ["java", "-Dfile.encoding=UTF-8", *self.java_options]
+        return args + ["-cp", classpath, "DukeWorker"]
+
+    def start(self):
+        self.process = sub.Popen(
+            self.command(),
+            stdin=sub.PIPE,
+            stdout=sub.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        logger.debug(f"Started duke worker with pid {self.process.pid}")
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def run(self, args):
+        """
+        Run duke with the command line arguments `args` and return its output.
+        """
+        if not self.alive:
+            self.start()
+        try:
+            self.process.stdin.write("\t".join(map(str, args)) + "\n")
+            self.process.stdin.flush()
+            output = []
+            for line in self.process.stdout:
+                line = line.rstrip("\n")
+                if line == "DONE":
+                    return "\n".join(output)
+                output.append(line.removeprefix("LOG\t"))
+        except (BrokenPipeError, OSError):
+            pass
+        self.close()
+        raise RuntimeError("duke worker crashed, it will be restarted with next run")
+
+    def close(self, timeout=10):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=timeout)
+        except (OSError, sub.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+class DukeWorkerPool:
+    """
+    Pool of `DukeWorker` processes shared by all duke runs of a process.
+
+    Workers are started lazily, up to `workers` runs are processed in
+    parallel when duke is called from several threads.
+
+    Parameters
+    ----------
+    workers : int, default 1
+        Maximal number of worker processes.
+    java_options : list, default None
+        Additional options passed to the JVM, e.g. ["-Xmx4g"].
+    """
+
+    def __init__(self, workers=1, java_options=None):
+        self.pid = os.getpid()
+        self.workers = max(int(workers), 1)
+        self.java_options = java_options
+        self.idle = queue.LifoQueue()
+        self.started = []
+        self.lock = threading.Lock()
+
+    def _acquire(self):
+        with self.lock:
+            if self.idle.empty() and len(self.started) < self.workers:
+                worker = DukeWorker(self.java_options)
+                self.started.append(worker)
+                return worker
+        return self.idle.get()
+
+    def run(self, args):
+        worker = self._acquire()
+        try:
+            return worker.run(args)
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.started:
+            worker.close()
+        self.started = []
+        self.idle = queue.LifoQueue()
+
+
+_worker_pool = None
+
+
+def get_worker_pool(config=None):
+    """
+    Return the duke worker pool of the current process. The pool is created
+    on first use with `duke_workers` workers and closed at exit.
+    """
+    global _worker_pool
+    if config is None:
+        config = get_config()
+    # forked processes must not share the pipes of the parent's workers
+    if _worker_pool is None or _worker_pool.pid != os.getpid():
+        _worker_pool = DukeWorkerPool(
+            config.get("duke_workers", 1), config.get("duke_java_options")
+        )
+        atexit.register(_worker_pool.close)
+    return _worker_pool
+
+
 def add_geoposition_for_duke(df):
     """
     Returns the same pandas.Dataframe with an additional column "Geoposition"
@@ -23,15 +189,69 @@ def add_geoposition_for_duke(df):
 
     """
     if not df.loc[:, ["lat", "lon"]].isnull().all().all():
+        # a single missing coordinate is passed as "nan" like str(np.nan),
+        # astype(str) keeps NaN as missing value
+        geoposition = df.lat.map(str) + "," + df.lon.map(str)
         return df.assign(
-            Geoposition=df[["lat", "lon"]]
-            .apply(lambda s: ",".join(map(str, s)), axis=1)
-            .replace("nan,nan", np.nan)
+            Geoposition=geoposition.where(df.lat.notnull() | df.lon.notnull())
         )
     else:
         return df.assign(Geoposition=np.nan)
 
 
+DUKE_COLUMN = re.compile(r'<column\s+name="([^"]+)"')
+
+
+def duke_records(df, xml):
+    """
+    Return the records of `df` as csv text holding only the id and the
+    columns read by the duke configuration `xml`.
+    """
+    df = add_geoposition_for_duke(df)
+    columns = [c for c in dict.fromkeys(DUKE_COLUMN.findall(xml)) if c in df]
+    return df[columns].to_csv(index_label="id")
+
+
+def _write_fifo(fn, text):
+    # blocks until duke opens the pipe for reading
+    try:
+        with open(fn, "w", encoding="utf-8") as f:
+            f.write(text)
+    except BrokenPipeError:
+        pass
+
+
+def _read_fifo(fn, lines):
+    # blocks until duke opens the pipe for writing, links are collected as
+    # soon as duke reports them
+    with open(fn, encoding="utf-8") as f:
+        for line in f:
+            lines.append(line)
+
+
+def _release_fifo(fn, thread, reading):
+    """
+    Unblock a thread waiting on the named pipe `fn` after duke has exited
+    without opening (or completely reading) it.
+    """
+    while thread.is_alive():
+        try:
+            flags = os.O_WRONLY if reading else os.O_RDONLY
+            fd = os.open(fn, flags | os.O_NONBLOCK)
+        except OSError:
+            # the thread has not opened its end yet
+            thread.join(0.01)
+            continue
+        try:
+            if not reading:
+                os.set_blocking(fd, True)
+                while os.read(fd, 1 << 16):
+                    pass
+        finally:
+            os.close(fd)
+        thread.join(0.1)
+
+
 def duke(
     datasets,
     labels=["one", "two"],
@@ -40,6 +260,10 @@ def duke(
     keepfiles=False,
     showoutput=False,
     threads=1,
+    engine=None,
+    blocking=None,
+    similarities=None,
+    config=None,
 ):
     """
     Run duke in different modes (Deduplication or Record Linkage Mode) to
@@ -60,16 +284,108 @@ def duke(
         of the first named dataset. This does not guarantee a unique match in
         the second named dataset.
     keepfiles : boolean, default False
-        If true, do not delete temporary files
+        If true, do not delete temporary files. The records are then always
+        passed to duke as files, also with `duke_transport: pipe` in the
+        config.
+    engine : str, default None
+        Matching engine to use, either "java" for running the duke binaries
+        in a Java subprocess, "worker" for sending the run to a pool of
+        long-lived Java processes (see `DukeWorkerPool`) or "native" for the
+        in-process implementation in `powerplantmatching.native`. Defaults to
+        `duke_engine` of the config.
+    blocking : str or list, default None
+        Column(s) used as hard blocking key. Only records with identical
+        values in these columns are compared, records with missing values are
+        not compared at all. The native engine handles all blocks in one
+        run, the Java engines run duke once per block in the same JVM
+        ("java") or in the pool of workers ("worker").
+    similarities : str, default None
+        Only for the native engine. Directory to store the similarities of
+        all properties for all candidate pairs in, one Parquet file per
+        compared pair of datasets named after the `labels` (see
+        `powerplantmatching.native.similarities_file`). The stored pairs can
+        be rescored with different thresholds and probability bounds via
+        `powerplantmatching.native.score_similarities` without running the
+        matching again.
+    config : dict, default None
+        Custom configuration, defaults to
+        `powerplantmatching.config.get_config()`.
     """
+    if config is None:
+        config = get_config()
+    if engine is None:
+        engine = config.get("duke_engine", "java")
 
+    if engine == "native":
+        candidates = config.get("native_candidates") or {}
+        kwargs = dict(
+            labels=labels,
+            blocking=blocking,
+            max_distance=candidates.get("max_distance"),
+            fueltype_blocking=candidates.get("fueltype", False),
+            name_top_k=candidates.get("name_top_k"),
+        )
+        if similarities is not None:
+            os.makedirs(similarities, exist_ok=True)
+            kwargs["similarities"] = similarities_file(similarities, labels)
+        return duke_native(datasets, singlematch=singlematch, **kwargs)
+    elif similarities is not None:
+        raise ValueError("Storing similarities requires the native engine.")
+    elif engine not in ["java", "worker"]:
+        raise ValueError(
+            f"Unknown duke engine '{engine}', use 'java', 'worker' or 'native'."
+        )
+
+    check_java()
+
+    kwargs = dict(
+        labels=labels,
+        singlematch=singlematch,
+        showmatches=showmatches,
+        keepfiles=keepfiles,
+        threads=threads,
+        config=config,
+    )
+    pool = get_worker_pool(config) if engine == "worker" else None
+    if blocking is None:
+        return _run_duke(datasets, pool=pool, **kwargs)
+
+    if isinstance(datasets, pd.DataFrame):
+        # blocks with a single record cannot contain duplicates
+        blocks = [
+            block
+            for _, block in datasets.groupby(blocking, sort=False)
+            if len(block) > 1
+        ]
+        columns = labels
+    else:
+        groups = [dict(list(df.groupby(blocking, sort=False))) for df in datasets]
+        blocks = [[groups[0][k], groups[1][k]] for k in groups[0] if k in groups[1]]
+        columns = [*labels, "scores"]
+    if engine == "java":
+        # all blocks are run by one JVM instead of starting one per block
+        pool = DukeWorkerPool(1, config.get("duke_java_options"))
     try:
-        sub.run(["java", "-version"], check=True, capture_output=True)
-    except sub.CalledProcessError:
-        err = "Java is not installed or not in the system's PATH. Please install Java and ensure it is in your system's PATH, then try again."
-        logger.error(err)
-        raise FileNotFoundError(err)
+        with ThreadPoolExecutor(pool.workers) as executor:
+            links = list(
+                executor.map(lambda b: _run_duke(b, pool=pool, **kwargs), blocks)
+            )
+    finally:
+        if engine == "java":
+            pool.close()
+    links = [link for link in links if not link.empty]
+    if not links:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(links, ignore_index=True)
+
 
+def _run_duke(
+    datasets, labels, singlematch, showmatches, keepfiles, threads, pool, config
+):
+    """
+    Run duke once on `datasets`, either in a new Java subprocess or, if
+    given, by a worker of the `DukeWorkerPool` `pool`.
+    """
     dedup = isinstance(datasets, pd.DataFrame)
     if dedup:
         # Deduplication mode
@@ -78,72 +394,113 @@ def duke(
     else:
         duke_config = "Comparison.xml"
 
-    duke_bin_dir = _package_data("duke_binaries")
+    transport = config.get("duke_transport", "files")
+    if transport not in ["files", "pipe"]:
+        raise ValueError(
+            f"Unknown duke transport '{transport}', use 'files' or 'pipe'."
+        )
+    # named pipes are only available on POSIX systems
+    pipe = transport == "pipe" and not keepfiles and hasattr(os, "mkfifo")
 
-    os.environ["CLASSPATH"] = os.pathsep.join(
-        [os.path.join(duke_bin_dir, r) for r in os.listdir(duke_bin_dir)]
-    )
     tmpdir = tempfile.mkdtemp()
+    fifos = []
 
     try:
-        shutil.copyfile(
-            os.path.join(_package_data(duke_config)), os.path.join(tmpdir, "config.xml")
-        )
+        with open(_package_data(duke_config), encoding="utf-8") as f:
+            xml = f.read()
 
         logger.debug("Comparing files: %s", ", ".join(labels))
 
+        records = []
         for n, df in enumerate(datasets):
-            df = add_geoposition_for_duke(df)
             #            due to index unity (see https://github.com/larsga/Duke/issues/236)
             if n == 1:
                 shift_by = datasets[0].index.max() + 1
-                df.index += shift_by
-            df.to_csv(os.path.join(tmpdir, f"file{n + 1}.csv"), index_label="id")
-            if n == 1:
-                df.index -= shift_by
-
-        args = [
-            "java",
-            "-Dfile.encoding=UTF-8",
-            "no.priv.garshol.duke.Duke",
-            "--linkfile=linkfile.txt",
-            f"--threads={threads}",
-        ]
+                df = df.set_axis(df.index + shift_by)
+            records.append(duke_records(df, xml))
+
+        linkfile = os.path.join(tmpdir, "linkfile.txt")
+        args = [f"--linkfile={linkfile}", f"--threads={threads}"]
+
+        # use absolute paths, as the worker processes do not run in tmpdir
+        for n in range(len(datasets)):
+            fn = f"file{n + 1}.csv"
+            xml = xml.replace(f'value="{fn}"', f'value="{os.path.join(tmpdir, fn)}"')
+
         if singlematch:
             args.append("--singlematch")
         if showmatches:
             args.append("--showmatches")
-            stdout = sub.PIPE
+        args.append(os.path.join(tmpdir, "config.xml"))
+
+        # in pipe mode the records, the configuration and the links are
+        # streamed through named pipes, nothing is written to disk
+        files = {
+            **{f"file{n + 1}.csv": text for n, text in enumerate(records)},
+            "config.xml": xml,
+        }
+        if pipe:
+            lines = []
+            for fn, text in files.items():
+                fn = os.path.join(tmpdir, fn)
+                os.mkfifo(fn)
+                thread = threading.Thread(
+                    target=_write_fifo, args=(fn, text), daemon=True
+                )
+                fifos.append((fn, thread, False))
+            os.mkfifo(linkfile)
+            thread = threading.Thread(
+                target=_read_fifo, args=(linkfile, lines), daemon=True
+            )
+            fifos.append((linkfile, thread, True))
+            for _, thread, _ in fifos:
+                thread.start()
         else:
-            stdout = None
-        args.append("config.xml")
-
-        run = sub.Popen(
-            args,
-            stderr=sub.PIPE,
-            cwd=tmpdir,
-            stdout=stdout,
-            universal_newlines=True,
-        )
-        _, stderr = run.communicate()
+            for fn, text in files.items():
+                with open(os.path.join(tmpdir, fn), "w", encoding="utf-8") as f:
+                    f.write(text)
 
-        if showmatches:
-            print(_)
+        if pool is not None:
+            stderr = pool.run(args)
+            if showmatches:
+                print(stderr)
+        else:
+            java = ["java", "-Dfile.encoding=UTF-8"]
+            java += config.get("duke_java_options") or []
+            java += ["-cp", duke_classpath(), "no.priv.garshol.duke.Duke"]
+            run = sub.Popen(
+                java + args,
+                stderr=sub.PIPE,
+                cwd=tmpdir,
+                stdout=sub.PIPE if showmatches else None,
+                universal_newlines=True,
+            )
+            _, stderr = run.communicate()
+
+            if showmatches:
+                print(_)
+
+        for fn, thread, reading in fifos:
+            _release_fifo(fn, thread, reading)
 
         logger.debug(f"Stderr: {stderr}")
         if any(word in stderr.lower() for word in ["error", "fehler"]):
             raise RuntimeError(f"duke failed: {stderr}")
 
+        if pipe:
+            links = "".join(lines)
+        elif os.path.exists(linkfile):
+            with open(linkfile, encoding="utf-8") as f:
+                links = f.read()
+        else:
+            links = ""
+        if not links:
+            return pd.DataFrame(columns=labels if dedup else [*labels, "scores"])
         if dedup:
-            return pd.read_csv(
-                os.path.join(tmpdir, "linkfile.txt"),
-                encoding="utf-8",
-                usecols=[1, 2],
-                names=labels,
-            )
+            return pd.read_csv(io.StringIO(links), usecols=[1, 2], names=labels)
         else:
             res = pd.read_csv(
-                os.path.join(tmpdir, "linkfile.txt"),
+                io.StringIO(links),
                 usecols=[1, 2, 3],
                 names=labels + ["scores"],
             )
@@ -152,6 +509,9 @@ def duke(
             return res
 
     finally:
+        for fn, thread, reading in fifos:
+            if thread.is_alive():
+                _release_fifo(fn, thread, reading)
         if keepfiles:
             logger.debug(f"Files of the duke run are kept in {tmpdir}")
         else:
@@ -11,16 +11,41 @@ from itertools import combinations
 
 import numpy as np
 import pandas as pd
-
+import scipy.sparse as sp
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse.csgraph import connected_components
+
+from .cache import (
+    cache_file,
+    hash_file,
+    hash_frame,
+    hash_objects,
+    read_cache,
+    write_cache,
+)
 from .cleaning import clean_technology
-from .core import get_config, get_obj_if_Acc
+from .core import _package_data, get_config, get_obj_if_Acc
 from .duke import duke
-from .utils import get_name, parmap, read_csv_if_string
+from .utils import get_name, parmap_frames, read_csv_if_string, shared_frame
 
 logger = logging.getLogger(__name__)
 
+# arguments of duke which do not affect the resulting links
+_OUTPUT_DUKEARGS = {"showmatches", "keepfiles", "showoutput", "threads"}
+
+# columns which determine the links between two datasets
+MATCHING_COLUMNS = [
+    "Name",
+    "Fueltype",
+    "Technology",
+    "Country",
+    "Capacity",
+    "lat",
+    "lon",
+]
+
 
-def best_matches(links):
+def best_matches(links, assignment="greedy"):
     """
     Subsequent to duke() with singlematch=True. Returns reduced list of
     matches on the base of the highest score for each duplicated entry.
@@ -29,14 +54,253 @@ def best_matches(links):
     ----------
     links : pd.DataFrame
         Links as returned by duke
+    assignment : str, default "greedy"
+        "greedy" keeps the link with the highest score for each entry of the
+        second dataset, entries of the first dataset might thus still have
+        several links. "optimal" returns the one-to-one assignment with the
+        maximal sum of scores, which is solved separately for every
+        connected component of the links. Use it on links of duke() with
+        singlematch=False.
     """
     labels = links.columns.difference({"scores"})
     if links.empty:
         return pd.DataFrame(columns=labels)
-    else:
+    if assignment == "greedy":
         scores = links["scores"].astype(float)
         best_idx = scores.groupby(links.iloc[:, 1], sort=False).idxmax()
         return links.loc[best_idx, labels].reset_index(drop=True)
+    if assignment != "optimal":
+        raise ValueError(f"Unknown assignment {assignment!r}")
+
+    links = links.reset_index(drop=True)
+    left, left_ids = pd.factorize(links.iloc[:, 0])
+    right, right_ids = pd.factorize(links.iloc[:, 1])
+    scores = links["scores"].to_numpy(dtype=float)
+
+    # links between entries with no other links are trivially assigned
+    graph = sp.coo_matrix(
+        (np.ones(len(links)), (left, len(left_ids) + right)),
+        shape=(len(left_ids) + len(right_ids),) * 2,
+    )
+    _, component = connected_components(graph, directed=False)
+    component = component[left]
+    single = ~pd.Series(component).duplicated(keep=False).to_numpy()
+    keep = [np.flatnonzero(single)]
+
+    grouped = pd.Series(np.flatnonzero(~single)).groupby(component[~single])
+    for idx in grouped.apply(np.asarray):
+        rows, i = np.unique(left[idx], return_inverse=True)
+        cols, j = np.unique(right[idx], return_inverse=True)
+        weights = np.zeros((len(rows), len(cols)))
+        weights[i, j] = scores[idx]
+        position = np.full(weights.shape, -1)
+        position[i, j] = idx
+        # assigned pairs without link are dropped
+        assigned = position[linear_sum_assignment(weights, maximize=True)]
+        keep.append(assigned[assigned >= 0])
+
+    keep = np.sort(np.concatenate(keep))
+    return links.loc[keep, labels].reset_index(drop=True)
+
+
+def _identifiers(df, column):
+    ids = df[column].map(
+        lambda x: list(x) if isinstance(x, (set, frozenset, list, tuple)) else [x]
+    )
+    ids = ids.explode().dropna()
+    ids = ids[ids.map(lambda x: isinstance(x, str))]
+    ids = ids.str.replace(r"\s+", "", regex=True).str.upper()
+    return ids[ids != ""]
+
+
+def prelink(dfs, labels, identifiers=["EIC"]):
+    """
+    Link the entries of two datasets which share an identifier, e.g. an EIC
+    code. Identifiers are compared after removing whitespace and converting
+    to upper case. Only unambiguous links are returned, i.e. entries linked
+    to several entries of the other dataset are left to the fuzzy matching.
+
+    Parameters
+    ----------
+    dfs : list of pandas.Dataframe
+        the two datasets to link
+    labels : list of strings
+        Names of the databases for the resulting dataframe
+    identifiers : list of strings, default ["EIC"]
+        Columns holding the identifiers, values might be strings or sets of
+        strings.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Links in the format of `duke`, all with a score of 1.0
+    """
+    links = []
+    for column in identifiers:
+        if not all(column in df for df in dfs):
+            continue
+        ids = [
+            _identifiers(df, column).rename_axis("id").rename("key").reset_index()
+            for df in dfs
+        ]
+        links.append(ids[0].merge(ids[1], on="key")[["id_x", "id_y"]])
+    if not links:
+        return pd.DataFrame(columns=[*labels, "scores"])
+
+    links = pd.concat(links).drop_duplicates()
+    unique = ~(links.id_x.duplicated(keep=False) | links.id_y.duplicated(keep=False))
+    return (
+        links[unique].set_axis(labels, axis=1).assign(scores=1.0).reset_index(drop=True)
+    )
+
+
+def _matches_cache_file(dfs, labels, config, country_wise=True, block=None, **dukeargs):
+    # the cache entries of single country blocks do not depend on the index
+    # of the entries, as the matches are stored by position within the block,
+    # nor on the other countries, only the rows of the block are hashed
+    assignment = config.get("match_assignment", "greedy")
+    dukeargs.setdefault("singlematch", assignment == "greedy")
+    identifiers = config.get("prelink_identifiers") or []
+    columns = MATCHING_COLUMNS + identifiers
+    if block is not None:
+        dfs = [df.reset_index(drop=True) for df in dfs]
+        labels = [*labels, block]
+    key = hash_objects(
+        *(hash_frame(df.reindex(columns=columns)) for df in dfs),
+        hash_file(_package_data("Comparison.xml")),
+        {k: v for k, v in dukeargs.items() if k not in _OUTPUT_DUKEARGS},
+        config["target_countries"] if country_wise and block is None else None,
+        config.get("duke_engine", "java"),
+        config.get("native_candidates"),
+        assignment,
+        identifiers,
+    )
+    return cache_file("matches", "_".join(labels), key, config)
+
+
+def comparison_costs(dfs, config=None, country_wise=True):
+    """
+    Return the number of record pairs compared between two datasets per
+    country of `target_countries`, derived from the number of entries per
+    country and fueltype. If the native engine only compares entries with
+    the same fueltype (`native_candidates: fueltype`), only pairs with the
+    same or a missing fueltype are counted. Countries without pairs are
+    dropped, an empty result means that there is nothing to compare.
+
+    Parameters
+    ----------
+    dfs : list of pandas.Dataframe
+        The two datasets to compare
+    config : dict, default None
+        Custom configuration, defaults to
+        `powerplantmatching.config.get_config()`.
+    country_wise : bool, default True
+        Whether entries are only compared within countries, otherwise all
+        pairs are counted in a single block with an empty label.
+    """
+    if config is None:
+        config = get_config()
+
+    counts = [
+        pd.DataFrame(
+            {
+                "Country": df["Country"] if country_wise else "",
+                "Fueltype": df.get("Fueltype", pd.Series(index=df.index)).fillna(""),
+            },
+            index=df.index,
+        )
+        .groupby(["Country", "Fueltype"])
+        .size()
+        .unstack(fill_value=0)
+        for df in dfs
+    ]
+    if country_wise:
+        counts = [c.reindex(config["target_countries"]).dropna() for c in counts]
+    counts = [
+        c.reindex(columns=counts[0].columns.union(counts[1].columns)) for c in counts
+    ]
+    a, b = (c.fillna(0) for c in counts)
+    a, b = a.align(b, join="inner")
+
+    engine = config.get("duke_engine", "java")
+    candidates = config.get("native_candidates") or {}
+    if engine == "native" and candidates.get("fueltype", False):
+        missing_a = a.pop("") if "" in a else 0
+        missing_b = b.pop("") if "" in b else 0
+        costs = (
+            (a * b).sum(axis=1)
+            + missing_a * (b.sum(axis=1) + missing_b)
+            + missing_b * a.sum(axis=1)
+        )
+    else:
+        costs = a.sum(axis=1) * b.sum(axis=1)
+    costs = costs.astype(int)
+    return costs[costs > 0]
+
+
+def _match_two_datasets(dfs, labels, country_wise, config, dukeargs):
+    """
+    Match two datasets. Entries are only linked within a country, the
+    matches of each country are cached separately if `cache_matches` is set,
+    such that updates of a dataset only match the countries with changed
+    entries again.
+    """
+    assignment = config.get("match_assignment", "greedy")
+    dukeargs = {"singlematch": assignment == "greedy", **dukeargs}
+
+    def match(dfs, blocking):
+        links = duke(dfs, labels, blocking=blocking, config=config, **dukeargs)
+        if links.empty:
+            return pd.DataFrame(columns=labels)
+        return best_matches(links, assignment=assignment)
+
+    if not country_wise:
+        return match(dfs, None)
+
+    # countries missing in either dataset are not passed to duke at all
+    countries = comparison_costs(dfs, config).index
+    blocks = {c: [df[df.Country == c] for df in dfs] for c in countries}
+    matches = dict.fromkeys(countries)
+    if config.get("cache_matches", False):
+        files = {
+            c: _matches_cache_file(block, labels, config, block=c, **dukeargs)
+            for c, block in blocks.items()
+        }
+        for c, fn in files.items():
+            positions = read_cache(fn)
+            if positions is not None:
+                matches[c] = pd.DataFrame(
+                    {
+                        label: df.index[positions[label].to_numpy(dtype=int)]
+                        for label, df in zip(labels, blocks[c])
+                    }
+                )
+
+    todo = [c for c, m in matches.items() if m is None]
+    if todo:
+        if len(todo) < len(countries):
+            logger.debug(
+                f"Reusing cached matches of {len(countries) - len(todo)} of "
+                f"{len(countries)} countries"
+            )
+        dfs = [pd.concat([blocks[c][i] for c in todo]) for i in (0, 1)]
+        new = match(dfs, "Country")
+        country = dfs[0].Country.reindex(new[labels[0]]).to_numpy()
+        for c in todo:
+            matches[c] = new[country == c].reset_index(drop=True)
+            if config.get("cache_matches", False):
+                positions = pd.DataFrame(
+                    {
+                        label: df.index.get_indexer(matches[c][label])
+                        for label, df in zip(labels, blocks[c])
+                    }
+                )
+                write_cache(positions, files[c])
+
+    matches = [m for m in matches.values() if not m.empty]
+    if not matches:
+        return pd.DataFrame(columns=labels)
+    return pd.concat(matches, ignore_index=True)
 
 
 def compare_two_datasets(dfs, labels, country_wise=True, config=None, **dukeargs):
@@ -60,7 +324,10 @@ def compare_two_datasets(dfs, labels, country_wise=True, config=None, **dukeargs
     labels : list of strings
         Names of the databases for the resulting dataframe
 
-
+    If `cache_matches` is set in the config, the matches are stored under
+    `matches/` with a key built from the content of both datasets, the duke
+    configuration and the matching arguments, and reused if none of them
+    changed.
     """
     if config is None:
         config = get_config()
@@ -74,36 +341,22 @@ def compare_two_datasets(dfs, labels, country_wise=True, config=None, **dukeargs
         logger.warning(msg + f"{used_deprecated_args}")
 
     dfs = list(map(read_csv_if_string, dfs))
+    assignment = config.get("match_assignment", "greedy")
     if "singlematch" not in dukeargs:
-        dukeargs["singlematch"] = True
-
-    def country_link(dfs, country):
-        # country_selector for both dataframes
-        sel_country_b = [df["Country"] == country for df in dfs]
-        # only append if country appears in both dataframse
-        if all(sel.any() for sel in sel_country_b):
-            return duke(
-                [df[sel] for df, sel in zip(dfs, sel_country_b)], labels, **dukeargs
-            )
-        else:
-            return pd.DataFrame(columns=[*labels, "scores"])
+        # the optimal assignment requires all links of an entry
+        dukeargs["singlematch"] = assignment == "greedy"
 
-    if country_wise:
-        countries = config["target_countries"]
-        links = [country_link(dfs, c) for c in countries]
-        links = [link for link in links if not link.empty]
-        if links:
-            links = pd.concat(links, ignore_index=True)
-        else:
-            links = pd.DataFrame(columns=[*labels, "scores"])
-    else:
-        links = duke(dfs, labels=labels, **dukeargs)
+    if config.get("cache_matches", False):
+        fn = _matches_cache_file(dfs, labels, config, country_wise, **dukeargs)
+        matches = read_cache(fn)
+        if matches is not None:
+            logger.info("Reusing cached matches of `{}` and `{}`".format(*labels))
+            return matches
 
-    if links.empty:
-        matches = pd.DataFrame(columns=labels)
-    else:
-        matches = best_matches(links)
+    matches = _match_two_datasets(dfs, labels, country_wise, config, dukeargs)
 
+    if config.get("cache_matches", False):
+        write_cache(matches, fn)
     return matches
 
 
@@ -114,6 +367,15 @@ def cross_matches(sets_of_pairs, labels=None):
     though they did not match directly but indirectly through a
     connecting identifier of another database.
 
+    Every (dataset, identifier) is a node of a graph with the pairs as
+    edges, each connected component results in one row. Components which
+    contain several identifiers of the same dataset are built again link by
+    link, starting with the links confirmed by most common neighbours, then
+    the links between the nodes with the most links (the first one on ties).
+    A link is dropped if it would join two identifiers of the same dataset,
+    such that only the weakest link of a conflict is cut and the other links
+    of its nodes are kept.
+
     Parameters
     ----------
     sets_of_pairs : list
@@ -128,46 +390,117 @@ def cross_matches(sets_of_pairs, labels=None):
     m_all = sets_of_pairs
     if labels is None:
         labels = np.unique([x.columns for x in m_all])
-    matches = None
-    for label in labels:
-        base = [m.set_index(label) for m in m_all if label in m and not m.empty]
-        if base:
-            match_base = pd.concat(base, axis=1).reset_index()
-            if matches is None:
-                matches = match_base.reindex(columns=labels)
-            else:
-                matches = pd.concat([matches, match_base], sort=True)
-
-    if matches is None or matches.empty:
+    labels = list(labels)
+    m_all = [m[m.columns.intersection(labels, sort=False)] for m in m_all]
+    m_all = [m for m in m_all if m.shape[1] > 1 and not m.empty]
+
+    if not m_all:
         logger.warning("No matches found")
         return pd.DataFrame(columns=labels)
 
+    # map every (dataset, identifier) to an integer node
+    ids = {
+        label: pd.Index(
+            pd.concat([m[label] for m in m_all if label in m]).dropna().unique()
+            if any(label in m for m in m_all)
+            else []
+        )
+        for label in labels
+    }
+    sizes = [len(ids[label]) for label in labels]
+    offsets = dict(zip(labels, np.cumsum([0] + sizes)))
+    source = np.repeat(np.arange(len(labels)), sizes)
+
+    edges = []
+    for m in m_all:
+        first = m.columns[0]
+        for other in m.columns[1:]:
+            pairs = m[[first, other]].dropna()
+            edges.append(
+                [
+                    offsets[label] + ids[label].get_indexer(pairs[label])
+                    for label in (first, other)
+                ]
+            )
+    u, v = map(np.concatenate, zip(*edges))
+    n = len(source)
+
+    graph = sp.coo_matrix((np.ones(len(u)), (u, v)), (n, n))
+    _, component = connected_components(graph, directed=False)
+    degree = np.bincount(u, minlength=n) + np.bincount(v, minlength=n)
+    duplicated = pd.DataFrame({"component": component, "source": source}).duplicated()
+    conflicting = np.isin(component[u], component[duplicated.to_numpy()])
+    if conflicting.any():
+        # union-find over the links of inconsistent components, the
+        # strongest links first, each root keeps the datasets of its tree
+        parent = list(range(n))
+        sources = [{s} for s in source.tolist()]
+        # links confirmed by a common neighbour are the strongest, then the
+        # links between the nodes with the most links
+        linked = np.flatnonzero(conflicting)
+        adjacency = (graph + graph.T).tocsr().astype(bool)
+        common = adjacency[u[linked]].multiply(adjacency[v[linked]]).sum(axis=1)
+        common = np.asarray(common).ravel()
+        strength = degree[u[linked]] + degree[v[linked]]
+        order = linked[np.lexsort((-strength, -common))]
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        keep = ~conflicting
+        for k, a, b in zip(order.tolist(), u[order].tolist(), v[order].tolist()):
+            a, b = find(a), find(b)
+            if a == b:
+                keep[k] = True
+            elif sources[a].isdisjoint(sources[b]):
+                parent[b] = a
+                sources[a] |= sources[b]
+                keep[k] = True
+        u, v = u[keep], v[keep]
+        graph = sp.coo_matrix((np.ones(len(u)), (u, v)), (n, n))
+        _, component = connected_components(graph, directed=False)
+        degree = np.bincount(u, minlength=n) + np.bincount(v, minlength=n)
+    nodes = pd.DataFrame({"component": component, "source": source})[degree > 0]
+
+    identifiers = np.concatenate(
+        [ids[label].to_numpy(dtype=object) for label in labels]
+    )
+    matches = (
+        nodes.assign(id=identifiers[nodes.index])
+        .pivot(index="component", columns="source", values="id")
+        .reindex(columns=range(len(labels)))
+        .set_axis(labels, axis=1)
+        .infer_objects()
+    )
+
     if matches.isnull().all().any():
         cols = ", ".join(matches.columns[matches.isnull().all()])
         logger.warning(f"No matches found for data source {cols}")
 
-    matches = matches.drop_duplicates().reset_index(drop=True)
-    for label in labels:
-        matches = pd.concat(
-            [
-                matches.groupby(label, as_index=False, sort=False).apply(
-                    lambda x: x.loc[x.isnull().sum(axis=1).idxmin()],
-                    include_groups=False,
-                ),
-                matches[matches[label].isnull()],
-            ]
-        ).reset_index(drop=True)
     return (
         matches.assign(length=matches.notna().sum(axis=1))
-        .sort_values(by="length", ascending=False)
+        .sort_values(by="length", ascending=False, kind="stable")
         .reset_index(drop=True)
         .drop("length", axis=1)
-        .reindex(columns=labels)
+        .rename_axis(columns=None)
     )
 
 
+def _compare_shared(args):
+    (c, d), labels, prelinked, config, dukeargs = args
+    logger.info("Comparing data sources `{}` and `{}`".format(*labels))
+    dfs = [shared_frame(c), shared_frame(d)]
+    dfs = [df.drop(index=ids) for df, ids in zip(dfs, prelinked)]
+    dukeargs = dict(dukeargs)
+    country_wise = dukeargs.pop("country_wise", True)
+    return _match_two_datasets(dfs, labels, country_wise, config, dukeargs)
+
+
 def link_multiple_datasets(
-    datasets, labels, use_saved_matches=False, config=None, **dukeargs
+    datasets, labels, use_saved_matches=False, config=None, changed=None, **dukeargs
 ):
     """
     Duke-based horizontal match of multiple databases. Returns the
@@ -186,6 +519,10 @@ def link_multiple_datasets(
     labels : list of strings
         Names of the databases in alphabetical order and corresponding
         order to the datasets
+    changed : list of strings, optional
+        Names of the databases which changed since the last matching. If
+        given, only the comparisons involving one of them are run, the
+        matches of all other pairs are read from the cache.
     """
     if config is None:
         config = get_config()
@@ -194,18 +531,103 @@ def link_multiple_datasets(
     labels = [get_name(df) for df in dfs]
 
     combs = list(combinations(range(len(labels)), 2))
+    if changed is not None and not config.get("cache_matches", False):
+        raise ValueError("Matching only changed datasets requires `cache_matches`.")
+
+    # cached matches are read here, the worker processes only get the
+    # uncached comparisons
+    all_matches = [None] * len(combs)
+    if config.get("cache_matches", False):
+        files = [
+            _matches_cache_file(
+                [dfs[c], dfs[d]], [labels[c], labels[d]], config, **dukeargs
+            )
+            for c, d in combs
+        ]
+        all_matches = list(map(read_cache, files))
+    if changed is not None:
+        for k, (c, d) in enumerate(combs):
+            if labels[c] in changed or labels[d] in changed:
+                all_matches[k] = None
+            elif all_matches[k] is None:
+                raise ValueError(
+                    f"No cached matches of `{labels[c]}` and `{labels[d]}`, "
+                    "rerun the full matching instead."
+                )
+    todo = [k for k, m in enumerate(all_matches) if m is None]
+    if config.get("cache_matches", False) and len(todo) < len(combs):
+        logger.info(
+            f"Reusing cached matches of {len(combs) - len(todo)} of "
+            f"{len(combs)} pairs of data sources"
+        )
 
-    def comp_dfs(dfs_lbs):
-        logger.info("Comparing data sources `{}` and `{}`".format(*dfs_lbs[2:]))
-        return compare_two_datasets(dfs_lbs[:2], dfs_lbs[2:], config=config, **dukeargs)
+    # entries sharing an identifier are linked directly and skip duke
+    identifiers = config.get("prelink_identifiers") or []
+    prelinks = {}
+    for k in todo:
+        c, d = combs[k]
+        prelinks[k] = prelink([dfs[c], dfs[d]], [labels[c], labels[d]], identifiers)
+        if not prelinks[k].empty:
+            logger.info(
+                f"Linked {len(prelinks[k])} entries of `{labels[c]}` and "
+                f"`{labels[d]}` by identifiers"
+            )
 
-    mapargs = [[dfs[c], dfs[d], labels[c], labels[d]] for c, d in combs]
-    all_matches = parmap(comp_dfs, mapargs)
+    frames = [df.reindex(columns=MATCHING_COLUMNS) for df in dfs]
+    mapargs = [
+        (
+            combs[k],
+            [labels[i] for i in combs[k]],
+            [prelinks[k].iloc[:, i].to_numpy() for i in (0, 1)],
+            config,
+            dukeargs,
+        )
+        for k in todo
+    ]
+    # comparisons without common countries are skipped, the others are
+    # dispatched largest first by the number of compared pairs
+    costs = [
+        comparison_costs(
+            [dfs[i].drop(index=ids) for i, ids in zip(combs[k], args[2])],
+            config,
+            country_wise=dukeargs.get("country_wise", True),
+        ).sum()
+        for k, args in zip(todo, mapargs)
+    ]
+    for k, cost in zip(todo, costs):
+        if not cost:
+            logger.info(
+                "Skipping data sources `{}` and `{}` without common countries".format(
+                    *[labels[i] for i in combs[k]]
+                )
+            )
+    jobs = [n for n, cost in enumerate(costs) if cost]
+    res = parmap_frames(
+        _compare_shared,
+        frames,
+        [mapargs[n] for n in jobs],
+        costs=[costs[n] for n in jobs],
+        config=config,
+    )
+    res = dict(zip(jobs, res))
+    for n, k in enumerate(todo):
+        c, d = combs[k]
+        matches = res.get(n, pd.DataFrame(columns=[labels[c], labels[d]]))
+        if not prelinks[k].empty:
+            labels_k = list(prelinks[k].columns[:2])
+            matches = pd.concat(
+                [prelinks[k][labels_k], matches[labels_k]], ignore_index=True
+            )
+        all_matches[k] = matches
+        if config.get("cache_matches", False):
+            write_cache(matches, files[k])
 
     return cross_matches(all_matches, labels=labels)
 
 
-def combine_multiple_datasets(datasets, labels=None, config=None, **dukeargs):
+def combine_multiple_datasets(
+    datasets, labels=None, config=None, changed=None, **dukeargs
+):
     """
     Duke-based horizontal match of multiple databases. Returns the
     matched dataframe including only the matched entries in a
@@ -224,6 +646,9 @@ def combine_multiple_datasets(datasets, labels=None, config=None, **dukeargs):
     labels : list of strings
         Names of the databases in alphabetical order and corresponding
         order to the datasets
+    changed : list of strings, optional
+        Names of the databases which changed since the last matching, see
+        `link_multiple_datasets`.
     """
     if config is None:
         config = get_config()
@@ -252,7 +677,9 @@ def combine_multiple_datasets(datasets, labels=None, config=None, **dukeargs):
             .reset_index(drop=True)
         )
 
-    crossmatches = link_multiple_datasets(datasets, labels, config=config, **dukeargs)
+    crossmatches = link_multiple_datasets(
+        datasets, labels, config=config, changed=changed, **dukeargs
+    )
     return combined_dataframe(crossmatches, datasets, config).reindex(
         columns=config["target_columns"], level=0
     )
@@ -0,0 +1,1282 @@
+# SPDX-FileCopyrightText: Contributors to powerplantmatching <https://github.com/pypsa/powerplantmatching>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+In-process implementation of the duke record linkage engine.
+
+The functions in this module reproduce the comparators and the bayesian
+scoring of the Java based duke engine as configured in the duke xml files
+(`Comparison.xml`, `Deleteduplicates.xml`). All similarities are computed
+vectorized over arrays of candidate pairs, so no Java installation and no
+temporary files are required.
+"""
+
+import json
+import logging
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+
+from .cache import hash_frame, hash_objects
+from .core import _package_data
+
+logger = logging.getLogger(__name__)
+
+_features: dict = {}
+
+# maximal number of candidate pairs which are scored at once
+CHUNKSIZE = 2_000_000
+# vocabularies up to this number of combinations are compared all at once
+DENSE_LIMIT = 1_000_000
+EARTH_RADIUS = 6_371_000.0  # in meters, as used by duke
+# number of sources whose features are kept in memory
+FEATURE_CACHE_SIZE = 32
+
+COMPARATORS = {
+    "no.priv.garshol.duke.comparators.JaroWinkler": "jarowinkler",
+    "no.priv.garshol.duke.comparators.JaroWinklerTokenized": "jarowinklertokenized",
+    "no.priv.garshol.duke.comparators.QGramComparator": "qgram",
+    "no.priv.garshol.duke.comparators.NumericComparator": "numeric",
+    "no.priv.garshol.duke.comparators.GeopositionComparator": "geoposition",
+    "no.priv.garshol.duke.comparators.ExactComparator": "exact",
+}
+
+
+def read_duke_config(fn):
+    """
+    Parse a duke xml configuration file.
+
+    Parameters
+    ----------
+    fn : str
+        Path to the duke xml file, e.g.
+        `powerplantmatching.core._package_data("Comparison.xml")`.
+
+    Returns
+    -------
+    dict
+        Dictionary with the keys "threshold" and "properties". The latter
+        maps each property name to a dictionary with the keys "comparator",
+        "low", "high", "column", "cleaner" and "params".
+    """
+    root = ET.parse(fn).getroot()
+
+    objects = {}
+    for obj in root.iter("object"):
+        params = {p.get("name"): p.get("value") for p in obj.iter("param")}
+        objects[obj.get("name")] = (COMPARATORS.get(obj.get("class")), params)
+
+    schema = root.find("schema")
+    properties = {}
+    for prop in schema.iter("property"):
+        if prop.get("type") == "id":
+            continue
+        comparator = prop.findtext("comparator").strip()
+        if comparator in objects:
+            comparator, params = objects[comparator]
+        else:
+            comparator, params = COMPARATORS.get(comparator), {}
+        if comparator is None:
+            raise NotImplementedError(
+                f"Comparator of property {prop.findtext('name')} is not supported "
+                "by the native engine."
+            )
+        properties[prop.findtext("name").strip()] = dict(
+            comparator=comparator,
+            low=float(prop.findtext("low")),
+            high=float(prop.findtext("high")),
+            params=params,
+        )
+
+    # only the first csv definition is needed as all groups share the columns
+    for column in root.iter("column"):
+        prop = column.get("property")
+        if prop in properties:
+            properties[prop].setdefault("column", column.get("name"))
+            properties[prop].setdefault("cleaner", column.get("cleaner") is not None)
+
+    return dict(threshold=float(schema.findtext("threshold")), properties=properties)
+
+
+# combining characters dropped by duke's `LowerCaseNormalizeCleaner`
+COMBINING = "[\u0300-\u036f\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]"
+# characters treated as whitespace by the cleaner
+WHITESPACE = "[ \t\n\r\xa0]+"
+
+
+def normalize(ds):
+    """
+    Lowercase and strip accents and surplus whitespaces as done by duke's
+    `LowerCaseNormalizeCleaner`.
+    """
+    return (
+        ds.str.normalize("NFD")
+        # the ring above is kept as "å", all other accents are dropped
+        .str.replace("[aA]\u030a", "\u00e5", regex=True)
+        .str.replace(COMBINING, "", regex=True)
+        # duke lowercases character-wise, without a final sigma
+        .str.replace("\u03a3", "\u03c3", regex=False)
+        .str.lower()
+        .str.replace(WHITESPACE, " ", regex=True)
+        .str.strip(" ")
+    )
+
+
+def _string_values(df, column, cleaner):
+    if column not in df:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+    values = df[column].astype(object)
+    values = values.where(values.isna(), values.astype(str)).astype(object)
+    if cleaner:
+        values = normalize(values)
+    return values.where(values.notna() & (values != ""))
+
+
+def property_values(df, prop):
+    """
+    Extract the values of a duke property from a power plant dataframe.
+
+    Missing values are represented by NaN and skipped in the comparison, as
+    duke does for empty csv fields. Numeric values which duke cannot parse
+    are represented by infinity. Geopositions are returned in degrees.
+    """
+    comparator, column = prop["comparator"], prop.get("column")
+    if comparator == "geoposition":
+        return df[["lat", "lon"]].to_numpy(dtype=float)
+    if comparator == "numeric":
+        raw = _string_values(df, column, False)
+        values = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=float)
+        # duke's Double.parseDouble does not accept "inf" or "nan"
+        invalid = raw.notna().to_numpy() & ~np.isfinite(values)
+        return np.where(invalid, np.inf, values)
+    return _string_values(df, column, prop.get("cleaner", False)).to_numpy(object)
+
+
+def is_string(prop):
+    return prop["comparator"] not in ("numeric", "geoposition")
+
+
+def _tokens(values):
+    # duke splits on spaces only
+    tokens = [[t for t in v.split(" ") if t] for v in values]
+    flat = np.array([t for ts in tokens for t in ts], dtype=object)
+    return flat, np.fromiter(map(len, tokens), int, len(tokens))
+
+
+def _qgrams(values, q=2):
+    grams = [{v[i : i + q] for i in range(len(v) - q + 1)} for v in values]
+    flat = np.array([g for gs in grams for g in gs], dtype=object)
+    return flat, np.fromiter(map(len, grams), int, len(grams))
+
+
+def _segments(counts, idx):
+    # positions of the flat entries belonging to the values `idx`
+    starts = np.cumsum(counts) - counts
+    n = counts[idx]
+    return np.repeat(starts[idx] - (np.cumsum(n) - n), n) + np.arange(n.sum())
+
+
+def source_features(df, config):
+    """
+    Return the features of a dataframe for all properties of a duke
+    configuration, i.e. numeric values, geopositions in degrees and for
+    string properties the codes of the records into their distinct cleaned
+    values. The tokens (for tokenized Jaro-Winkler) or q-grams (for the
+    q-gram comparator) of the distinct values are stored as flat arrays
+    with the number of entries per value.
+
+    The features are kept in memory for the last `FEATURE_CACHE_SIZE`
+    dataframes and looked up by the content of the compared columns, such
+    that a source is prepared only once for all of its comparisons.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+    config : dict
+        Duke configuration as returned by `read_duke_config`.
+    """
+    properties = config["properties"]
+    columns = {
+        c
+        for prop in properties.values()
+        for c in (
+            ["lat", "lon"] if prop["comparator"] == "geoposition" else [prop["column"]]
+        )
+    }
+    key = hash_objects(
+        hash_frame(df[[c for c in df.columns if c in columns]]), properties
+    )
+    if key in _features:
+        return _features[key]
+
+    features = {}
+    for name, prop in properties.items():
+        raw = property_values(df, prop)
+        if not is_string(prop):
+            features[name] = raw
+            continue
+        codes, values = pd.factorize(raw)
+        values = np.asarray(values, dtype=object)
+        features[name] = dict(codes=codes, values=values)
+        if prop["comparator"] == "jarowinklertokenized":
+            features[name]["tokens"] = _tokens(values)
+        elif prop["comparator"] == "qgram":
+            features[name]["grams"] = _qgrams(values)
+
+    if len(_features) >= FEATURE_CACHE_SIZE:
+        _features.pop(next(iter(_features)))
+    _features[key] = features
+    return features
+
+
+def encode(datasets, config):
+    """
+    Extract the property values of all datasets. String values are encoded
+    as integer codes (-1 for missing values) into a vocabulary shared by all
+    datasets, such that every distinct combination of values is compared
+    only once. The values are taken from the `source_features` of the
+    datasets.
+
+    Returns
+    -------
+    values : list of dict
+        Property values for each dataset.
+    vocabs : dict
+        Vocabulary for each string property.
+    """
+    features = [source_features(df, config) for df in datasets]
+    values = [{} for _ in datasets]
+    vocabs = {}
+    for name, prop in config["properties"].items():
+        sources = [f[name] for f in features]
+        if not is_string(prop):
+            for v, source in zip(values, sources):
+                v[name] = source
+            continue
+        # merge the distinct values of all datasets
+        codes, vocab = pd.factorize(np.concatenate([f["values"] for f in sources]))
+        splits = np.cumsum([len(f["values"]) for f in sources])[:-1]
+        for v, f, c in zip(values, sources, np.split(codes, splits)):
+            v[name] = np.append(c, -1)[f["codes"]]
+        vocabs[name] = dict(values=np.asarray(vocab, dtype=object), table=None)
+        first = np.unique(codes, return_index=True)[1]
+        for kind in ("tokens", "grams"):
+            if kind in sources[0]:
+                flat = np.concatenate([f[kind][0] for f in sources])
+                counts = np.concatenate([f[kind][1] for f in sources])
+                vocabs[name][kind] = (flat[_segments(counts, first)], counts[first])
+    return values, vocabs
+
+
+def _utf16(strings):
+    # duke compares the UTF-16 code units of java strings
+    units = [np.frombuffer(s.encode("utf-16-le"), np.uint16) for s in strings]
+    lengths = np.fromiter(map(len, units), int, len(units))
+    return units, lengths
+
+
+def jaro_winkler(s1, s2):
+    """
+    Vectorized Jaro-Winkler similarity as implemented by duke.
+
+    Parameters
+    ----------
+    s1, s2 : array-like of str
+        Strings to compare pairwise, both of the same length.
+
+    Returns
+    -------
+    np.ndarray
+    """
+    s1 = np.asarray(s1, dtype=object)
+    s2 = np.asarray(s2, dtype=object)
+    if not len(s1):
+        return np.empty(0)
+    (u1, len1), (u2, len2) = _utf16(s1), _utf16(s2)
+    # duke ensures that the first string is not the longer one
+    swap = len1 > len2
+    u1, u2 = (
+        [b if w else a for a, b, w in zip(u1, u2, swap)],
+        [a if w else b for a, b, w in zip(u1, u2, swap)],
+    )
+    len1, len2 = np.where(swap, len2, len1), np.where(swap, len1, len2)
+
+    def encode(units, lengths, fill):
+        codes = np.full((len(units), max(lengths.max(), 1)), fill, dtype=np.int32)
+        rows = np.repeat(np.arange(len(units)), lengths)
+        cols = np.arange(lengths.sum()) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        codes[rows, cols] = np.concatenate(units)
+        return codes
+
+    c1, c2 = encode(u1, len1, -1), encode(u2, len2, -2)
+    maxdist = len2 // 2
+    positions = np.arange(c2.shape[1])
+    rows = np.arange(len(s1))
+
+    # each character of the second string is matched at most once, the
+    # first unmatched equal character within the window is taken
+    matched = np.zeros(c2.shape, dtype=bool)
+    common = np.zeros(len(s1), dtype=int)
+    transpositions = np.zeros(len(s1), dtype=int)
+    prevpos = np.full(len(s1), -1)
+    for ix in range(c1.shape[1]):
+        lo = np.maximum(0, ix - maxdist)
+        hi = np.minimum(len2, ix + maxdist)
+        window = (positions >= lo[:, None]) & (positions < hi[:, None])
+        eq = (c2 == c1[:, [ix]]) & window & ~matched
+        found = eq.any(axis=1)
+        pos = eq.argmax(axis=1)
+        matched[rows[found], pos[found]] = True
+        common += found
+        transpositions += found & (prevpos != -1) & (pos < prevpos)
+        prevpos = np.where(found, pos, prevpos)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = (common / len1 + common / len2 + (common - transpositions) / common) / 3
+    score = np.where(common == 0, 0.0, score)
+
+    width = min(4, c1.shape[1], c2.shape[1])
+    prefix = (c1[:, :width] == c2[:, :width]) & (np.arange(width) < len1[:, None])
+    prefix = np.cumprod(prefix, axis=1).sum(axis=1)
+    score = score + prefix * (1 - score) / 10
+    return np.where(s1 == s2, 1.0, score)
+
+
+def _tokenize(vocab, tokens=None):
+    flat, ntokens = _tokens(vocab) if tokens is None else tokens
+    codes, uniques = pd.factorize(pd.Index(flat, dtype=object))
+    indptr = np.concatenate([[0], np.cumsum(ntokens)])
+    return codes, indptr, ntokens, np.asarray(uniques, dtype=object)
+
+
+def jaro_winkler_tokenized(vocab, a, b, tokenized=None):
+    """
+    Tokenized Jaro-Winkler similarity between the vocabulary entries with
+    the codes `a` and `b` as implemented by duke. All token pairs are
+    compared, then the pairs are assigned greedily one-to-one in the order
+    of decreasing similarity. The similarity is the sum of the assigned
+    pairs divided by the number of tokens of the value with fewer tokens.
+    The tokenization of the vocabulary as returned by `_tokenize` can be
+    passed as `tokenized`.
+    """
+    if not len(a):
+        return np.empty(0)
+    if tokenized is None:
+        tokenized = _tokenize(vocab)
+    codes, indptr, ntokens, tokens = tokenized
+    # duke compares the tokens of the value with fewer tokens (the first
+    # one on equal counts) with those of the other one
+    swap = ntokens[a] > ntokens[b]
+    first, second = np.where(swap, b, a), np.where(swap, a, b)
+    n1, n2 = ntokens[first], ntokens[second]
+
+    # one row per (pair, token of first value, token of second value)
+    size = n1 * n2
+    pair = np.repeat(np.arange(len(a)), size)
+    k = np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size)
+    ix1, ix2 = k // n2[pair], k % n2[pair]
+    t1 = codes[indptr[first][pair] + ix1]
+    t2 = codes[indptr[second][pair] + ix2]
+
+    key = t1.astype(np.int64) * len(tokens) + t2
+    ukey, inverse = np.unique(key, return_inverse=True)
+    sim = jaro_winkler(tokens[ukey // len(tokens)], tokens[ukey % len(tokens)])
+    sim = sim[inverse]
+
+    # stable sort by decreasing similarity within each pair, then take the
+    # best remaining token pair of every pair in rounds
+    order = np.lexsort((k, -sim, pair))
+    pair, sim = pair[order], sim[order]
+    used1 = (np.cumsum(n1) - n1)[pair] + ix1[order]
+    used2 = (np.cumsum(n2) - n2)[pair] + ix2[order]
+    free1 = np.ones(n1.sum(), dtype=bool)
+    free2 = np.ones(n2.sum(), dtype=bool)
+    total = np.zeros(len(a))
+    alive = np.arange(len(pair))
+    while len(alive):
+        _, best = np.unique(pair[alive], return_index=True)
+        best = alive[best]
+        total += np.bincount(pair[best], sim[best], minlength=len(a))
+        free1[used1[best]] = False
+        free2[used2[best]] = False
+        alive = alive[free1[used1[alive]] & free2[used2[alive]]]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res = np.where(n1 > 0, total / n1, 0.0)
+    return np.where(a == b, 1.0, res)
+
+
+def _qgram_incidence(vocab, grams=None, q=2):
+    flat, counts = _qgrams(vocab, q) if grams is None else grams
+    cols, _ = pd.factorize(pd.Index(flat, dtype=object))
+    rows = np.repeat(np.arange(len(counts)), counts)
+    incidence = sp.csr_matrix(
+        (np.ones(len(cols)), (rows, cols)), shape=(len(counts), max(len(cols), 1))
+    )
+    return incidence, counts
+
+
+def qgram(vocab, a, b, q=2, incidence=None):
+    """
+    Q-gram overlap similarity between the vocabulary entries with the codes
+    `a` and `b`, the default of duke's `QGramComparator`. The incidence
+    matrix of the q-grams as returned by `_qgram_incidence` can be passed as
+    `incidence`.
+    """
+    if incidence is None:
+        incidence = _qgram_incidence(vocab, q=q)
+    incidence, counts = incidence
+    common = np.asarray(incidence[a].multiply(incidence[b]).sum(axis=1)).ravel()
+    denominator = np.minimum(counts[a], counts[b])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sim = np.where(denominator > 0, common / denominator, 0.0)
+    return np.where(a == b, 1.0, sim)
+
+
+def numeric(x, y):
+    """
+    Ratio of the smaller and the larger value as in duke's
+    `NumericComparator`. Values duke cannot parse (infinite ones) have a
+    similarity of 0.5.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    negative = (x < 0) & (y < 0)
+    x, y = np.where(negative, -x, x), np.where(negative, -y, y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.minimum(x, y) / np.maximum(x, y)
+    ratio = np.where((x == 0) & (y == 0), 1.0, ratio)
+    ratio = np.where(ratio < 0, 0.0, ratio)
+    ratio = np.where(np.isinf(x) | np.isinf(y), 0.5, ratio)
+    return np.where(np.isnan(x) | np.isnan(y), np.nan, ratio)
+
+
+def haversine(p1, p2):
+    """
+    Great circle distance in meters between two arrays of (lat, lon) pairs
+    given in degrees, computed as by duke.
+    """
+    lat1, lon1 = p1.T
+    lat2, lon2 = p2.T
+    dlat = np.radians(lat2 - lat1)
+    dlon = np.radians(lon2 - lon1)
+    h = np.sin(dlat / 2) * np.sin(dlat / 2) + np.sin(dlon / 2) * np.sin(
+        dlon / 2
+    ) * np.cos(np.radians(lat1)) * np.cos(np.radians(lat2))
+    with np.errstate(invalid="ignore"):
+        return EARTH_RADIUS * (2 * np.arctan2(np.sqrt(h), np.sqrt(1 - h)))
+
+
+def geoposition(p1, p2, max_distance):
+    """
+    Similarity of two geopositions (in degrees) as in duke's
+    `GeopositionComparator`. It decreases linearly from 1 to 0.5 at
+    `max_distance` and is zero beyond. Positions outside of the valid range
+    have a similarity of 0.5. Positions without coordinates are skipped, as
+    `add_geoposition_for_duke` does not pass them to duke. Positions with a
+    single missing coordinate are passed as "lat,nan", which duke fails to
+    parse and compares with a similarity of 0.5.
+    """
+    distance = haversine(p1, p2)
+    with np.errstate(invalid="ignore"):
+        sim = np.where(
+            distance > max_distance, 0.0, (1 - distance / max_distance) * 0.5 + 0.5
+        )
+
+    def valid(p):
+        lat, lon = p.T
+        with np.errstate(invalid="ignore"):
+            return (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+
+    sim = np.where(valid(p1) & valid(p2), sim, 0.5)
+    partial = np.isnan(p1).any(axis=1) | np.isnan(p2).any(axis=1)
+    sim = np.where(partial, 0.5, sim)
+    missing = np.isnan(p1).all(axis=1) | np.isnan(p2).all(axis=1)
+    return np.where(missing, np.nan, sim)
+
+
+def _compare_vocab(comparator, vocab, a, b):
+    # the tokens and q-grams of the vocabulary are prepared once per run
+    values = vocab["values"]
+    if comparator == "jarowinklertokenized":
+        if vocab.get("tokenized") is None:
+            vocab["tokenized"] = _tokenize(values, vocab.get("tokens"))
+        return jaro_winkler_tokenized(values, a, b, tokenized=vocab["tokenized"])
+    elif comparator == "jarowinkler":
+        return jaro_winkler(values[a], values[b])
+    elif comparator == "qgram":
+        if vocab.get("incidence") is None:
+            vocab["incidence"] = _qgram_incidence(values, vocab.get("grams"))
+        return qgram(values, a, b, incidence=vocab["incidence"])
+    return (a == b).astype(float)
+
+
+def _string_similarity(comparator, vocab, a, b):
+    missing = (a < 0) | (b < 0)
+    sim = np.full(len(a), np.nan)
+    a, b = a[~missing], b[~missing]
+    n = len(vocab["values"])
+    if n * n <= DENSE_LIMIT:
+        # small vocabularies (e.g. fueltypes) are compared all at once
+        if vocab["table"] is None:
+            grid = np.arange(n * n)
+            vocab["table"] = _compare_vocab(
+                comparator, vocab, grid // max(n, 1), grid % max(n, 1)
+            )
+        sim[~missing] = vocab["table"][a.astype(np.int64) * n + b]
+        return sim
+    # compute similarities only once per unique combination of values
+    ukey, inverse = np.unique(a.astype(np.int64) * n + b, return_inverse=True)
+    usim = _compare_vocab(comparator, vocab, ukey // n, ukey % n)
+    sim[~missing] = usim[inverse]
+    return sim
+
+
+def similarity(prop, v1, v2, vocab=None):
+    """
+    Compute the raw similarities of a property for arrays of value pairs.
+    NaN is returned where at least one of the values is missing.
+    """
+    comparator = prop["comparator"]
+    if comparator == "numeric":
+        return numeric(v1, v2)
+    if comparator == "geoposition":
+        max_distance = float(prop["params"].get("max-distance", np.inf))
+        return geoposition(v1, v2, max_distance)
+    return _string_similarity(comparator, vocab, v1, v2)
+
+
+def probability(sim, low, high):
+    """
+    Translate similarities into match probabilities as done by duke.
+    """
+    prob = np.where(sim >= 0.5, (high - 0.5) * sim**2 + 0.5, low)
+    return np.where(np.isnan(sim), np.nan, prob)
+
+
+def bayes(p, q):
+    """
+    Bayesian combination of two probabilities, missing values in `q` leave
+    `p` unchanged.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        combined = p * q / (p * q + (1 - p) * (1 - q))
+    return np.where(np.isnan(q), p, np.nan_to_num(combined))
+
+
+def is_expensive(prop):
+    return prop["comparator"] in ("jarowinkler", "jarowinklertokenized")
+
+
+def score_pairs(values1, values2, vocabs, i, j, config):
+    """
+    Score candidate pairs of records.
+
+    Cheap properties are evaluated first. Pairs which cannot exceed the
+    threshold even with a perfect similarity of the expensive (string)
+    properties are not evaluated any further.
+
+    Parameters
+    ----------
+    values1, values2 : dict
+        Property values of the two datasets as returned by `encode`.
+    vocabs : dict
+        Vocabularies of the string properties as returned by `encode`.
+    i, j : np.ndarray
+        Positions of the candidate pairs in the first and second dataset.
+    config : dict
+        Duke configuration as returned by `read_duke_config`.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        Positions and scores of all pairs exceeding the threshold.
+    """
+    properties = config["properties"]
+    threshold = config["threshold"]
+    scores = np.full(len(i), 0.5)
+    for name, prop in properties.items():
+        if not is_expensive(prop):
+            sim = similarity(prop, values1[name][i], values2[name][j], vocabs.get(name))
+            scores = bayes(scores, probability(sim, prop["low"], prop["high"]))
+
+    for name, prop in properties.items():
+        if is_expensive(prop):
+            best = bayes(scores, np.full(len(scores), prop["high"]))
+            keep = best > threshold
+            i, j, scores = i[keep], j[keep], scores[keep]
+            sim = similarity(prop, values1[name][i], values2[name][j], vocabs.get(name))
+            scores = bayes(scores, probability(sim, prop["low"], prop["high"]))
+
+    keep = scores > threshold
+    return i[keep], j[keep], scores[keep]
+
+
+def self_scores(df, duke_config):
+    """
+    Score every record of a dataframe against itself, i.e. the score of a
+    pair of records with identical values. Pairs of records with missing
+    values or zero similarity to themselves might not exceed the threshold.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+    duke_config : str
+        Path to the duke xml file.
+    """
+    config = read_duke_config(duke_config)
+    (values,), vocabs = encode([df], config)
+    scores = np.full(len(df), 0.5)
+    for name, prop in config["properties"].items():
+        v = values[name]
+        if is_string(prop):
+            # each distinct value is compared with itself once
+            sim = np.full(len(df), np.nan)
+            codes, inverse = np.unique(v[v >= 0], return_inverse=True)
+            usim = _compare_vocab(prop["comparator"], vocabs[name], codes, codes)
+            sim[v >= 0] = usim[inverse]
+        else:
+            sim = similarity(prop, v, v)
+        scores = bayes(scores, probability(sim, prop["low"], prop["high"]))
+    return pd.Series(scores, index=df.index)
+
+
+def duke_columns(duke_config):
+    """
+    Return the columns of a power plant dataframe which are compared by a
+    duke configuration.
+    """
+    columns = []
+    for prop in read_duke_config(duke_config)["properties"].values():
+        if prop["comparator"] == "geoposition":
+            columns += ["lat", "lon"]
+        else:
+            columns.append(prop["column"])
+    return columns
+
+
+def block_codes(datasets, blocking):
+    """
+    Encode the blocking key(s) of the datasets into integer codes shared by
+    all datasets. Records with missing keys get the code -1.
+    """
+    sizes = [len(df) for df in datasets]
+    if blocking is None:
+        return [np.zeros(n, dtype=int) for n in sizes]
+    keys = pd.concat([df[np.atleast_1d(blocking)] for df in datasets])
+    codes = keys.groupby(list(keys.columns), sort=False).ngroup()
+    codes = codes.fillna(-1).to_numpy(dtype=int)
+    return np.split(codes, np.cumsum(sizes)[:-1])
+
+
+def block_pairs(blocks1, blocks2, dedup):
+    """
+    Yield chunks of candidate pairs comparing every record of the first
+    dataset with every record of the second one in the same block, as done
+    by duke's `InMemoryDatabase` for a single block.
+
+    Parameters
+    ----------
+    blocks1, blocks2 : np.ndarray
+        Block codes of the records as returned by `block_codes`. Records with
+        negative codes are skipped.
+    dedup : bool
+        Whether both datasets are the same, pairs of a record with itself
+        are skipped.
+    """
+    order = np.argsort(blocks2, kind="stable")
+    sorted_blocks = blocks2[order]
+    start = np.searchsorted(sorted_blocks, blocks1, "left")
+    count = np.searchsorted(sorted_blocks, blocks1, "right") - start
+    count[blocks1 < 0] = 0
+
+    chunk = np.cumsum(count) // CHUNKSIZE
+    for rows in np.split(np.arange(len(blocks1)), np.flatnonzero(np.diff(chunk)) + 1):
+        c = count[rows]
+        i = np.repeat(rows, c)
+        offset = np.arange(c.sum()) - np.repeat(np.cumsum(c) - c, c)
+        j = order[np.repeat(start[rows], c) + offset]
+        if dedup:
+            i, j = i[i != j], j[i != j]
+        yield i, j
+
+
+def _unit_vectors(coords):
+    lat, lon = coords.T
+    return np.column_stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+    )
+
+
+def spatial_pairs(
+    blocks1, blocks2, coords1, coords2, max_distance, dedup, pairs=block_pairs
+):
+    """
+    Yield chunks of candidate pairs within the same block. If both records
+    have a geoposition, they are only paired if they are not further apart
+    than `max_distance` (in meters). Records without geoposition are paired
+    with all records of the block, or as given by `pairs`, a function with
+    the signature of `block_pairs`.
+
+    The neighbours are looked up with a KD-tree on the unit sphere, where
+    the block code is added as fourth coordinate to separate the blocks.
+    """
+    located1 = ~np.isnan(coords1).any(axis=1)
+    located2 = ~np.isnan(coords2).any(axis=1)
+
+    idx1 = np.flatnonzero(located1 & (blocks1 >= 0))
+    idx2 = np.flatnonzero(located2 & (blocks2 >= 0))
+    if len(idx1) and len(idx2):
+        chord = 2 * np.sin(min(max_distance / EARTH_RADIUS / 2, np.pi / 2))
+        # chords are at most 2, blocks are thus separated by an offset of 4
+        points1 = np.column_stack([_unit_vectors(coords1[idx1]), 4.0 * blocks1[idx1]])
+        points2 = np.column_stack([_unit_vectors(coords2[idx2]), 4.0 * blocks2[idx2]])
+        tree1 = cKDTree(points1)
+        same = dedup and np.array_equal(points1, points2)
+        tree2 = tree1 if same else cKDTree(points2)
+        near = tree1.sparse_distance_matrix(tree2, chord, output_type="ndarray")
+        i, j = idx1[near["i"]], idx2[near["j"]]
+        if dedup:
+            i, j = i[i != j], j[i != j]
+        for start in range(0, len(i), CHUNKSIZE):
+            yield i[start : start + CHUNKSIZE], j[start : start + CHUNKSIZE]
+
+    # pairs with at least one record without geoposition
+    yield from pairs(np.where(located1, -1, blocks1), blocks2, dedup)
+    yield from pairs(
+        np.where(located1, blocks1, -1), np.where(located2, -1, blocks2), dedup
+    )
+
+
+def name_vectors(names, n=3):
+    """
+    Return the l2-normalized TF-IDF vectors of the character `n`-grams of
+    the lowercased names as sparse matrix with one row per name. Rows of
+    missing names are empty.
+
+    Parameters
+    ----------
+    names : list of pd.Series
+        Names of all datasets, the vocabulary and the inverse document
+        frequencies are shared among them.
+    """
+    sizes = [len(ds) for ds in names]
+    padded = pd.concat(names, ignore_index=True).fillna("").str.lower()
+    padded = (" " * (n - 1) + padded + " ").where(padded != "", "")
+    grams = [[s[k : k + n] for k in range(len(s) - n + 1)] for s in padded]
+    rows = np.repeat(np.arange(len(grams)), [len(g) for g in grams])
+    codes, vocab = pd.factorize(np.array([g for gs in grams for g in gs], dtype=object))
+    tf = sp.csr_matrix(
+        (np.ones(len(codes)), (rows, codes)), shape=(len(grams), len(vocab))
+    )
+    tf.sum_duplicates()
+    nrecords = (np.diff(tf.indptr) > 0).sum()
+    idf = np.log((1 + nrecords) / (1 + tf.getnnz(axis=0))) + 1
+    tfidf = tf @ sp.diags(idf)
+    norms = np.sqrt(tfidf.multiply(tfidf).sum(axis=1)).A1
+    tfidf = (
+        sp.diags(np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)) @ tfidf
+    )
+    tfidf = tfidf.tocsr()
+    starts = np.cumsum([0, *sizes])
+    return [tfidf[start:stop] for start, stop in zip(starts[:-1], starts[1:])]
+
+
+def _top_k(a, b, top_k, rows_a=None, rows_b=None):
+    # local indices of the top_k most similar rows of b for each row of a,
+    # selected from the sparse products of chunks of a with b, such that no
+    # dense similarity matrix is built; pairs with rows_a[i] == rows_b[j],
+    # i.e. of a record with itself, are skipped
+    step = max(CHUNKSIZE // max(b.shape[0], 1), 1)
+    res_i, res_j = [], []
+    for start in range(0, a.shape[0], step):
+        sims = (a[start : start + step] @ b.T).tocoo()
+        i, j, data = sims.row + start, sims.col, sims.data
+        keep = data > 0
+        if rows_a is not None:
+            keep &= rows_a[i] != rows_b[j]
+        i, j, data = i[keep], j[keep], data[keep]
+        # rank the similarities within each row, descending
+        order = np.lexsort((j, -data, i))
+        i, j = i[order], j[order]
+        first = np.searchsorted(i, i, "left")
+        keep = np.arange(len(i)) - first < top_k
+        res_i.append(i[keep])
+        res_j.append(j[keep])
+    if not res_i:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    return np.concatenate(res_i), np.concatenate(res_j)
+
+
+def name_pairs(blocks1, blocks2, dedup, vectors1, vectors2, top_k):
+    """
+    Yield chunks of candidate pairs within the same block whose names are
+    among the `top_k` most similar ones, measured by the cosine similarity
+    of the TF-IDF vectors of `name_vectors`. A pair is kept if the name of
+    either record is among the nearest names of the other one. Records
+    without name are paired with all records of the block.
+    """
+    named1 = np.diff(vectors1.indptr) > 0
+    named2 = np.diff(vectors2.indptr) > 0
+    members1 = pd.Series(np.arange(len(blocks1))[named1 & (blocks1 >= 0)])
+    members2 = pd.Series(np.arange(len(blocks2))[named2 & (blocks2 >= 0)])
+    members1 = members1.groupby(blocks1[members1.to_numpy()]).indices
+    members2 = members2.groupby(blocks2[members2.to_numpy()]).indices
+    index1 = np.flatnonzero(named1 & (blocks1 >= 0))
+    index2 = np.flatnonzero(named2 & (blocks2 >= 0))
+
+    for block, pos1 in members1.items():
+        if block not in members2:
+            continue
+        rows1, rows2 = index1[pos1], index2[members2[block]]
+        a, b = vectors1[rows1], vectors2[rows2]
+        # in deduplication mode the records of both sides may differ, e.g.
+        # only records without fueltype are compared with all records, the
+        # pairs of a record with itself are thus skipped by their row ids
+        ids = (rows1, rows2) if dedup else (None, None)
+        i, j = _top_k(a, b, top_k, *ids)
+        # the nearest names of the second dataset, for the same records on
+        # both sides these are the same pairs mirrored
+        if dedup and np.array_equal(rows1, rows2):
+            jt, it = i, j
+        else:
+            jt, it = _top_k(b, a, top_k, *ids[::-1])
+        keys = np.unique(np.concatenate([i, it]) * len(rows2) + np.concatenate([j, jt]))
+        i, j = rows1[keys // len(rows2)], rows2[keys % len(rows2)]
+        for start in range(0, len(i), CHUNKSIZE):
+            yield i[start : start + CHUNKSIZE], j[start : start + CHUNKSIZE]
+
+    # pairs with at least one record without name
+    yield from block_pairs(np.where(named1, -1, blocks1), blocks2, dedup)
+    yield from block_pairs(
+        np.where(named1, blocks1, -1), np.where(named2, -1, blocks2), dedup
+    )
+
+
+def candidate_pairs(
+    blocks1,
+    blocks2,
+    dedup,
+    coords1=None,
+    coords2=None,
+    fueltypes1=None,
+    fueltypes2=None,
+    max_distance=None,
+    names1=None,
+    names2=None,
+    name_top_k=None,
+):
+    """
+    Yield chunks of candidate pairs which are passed to the scoring.
+
+    Parameters
+    ----------
+    blocks1, blocks2 : np.ndarray
+        Block codes of the records as returned by `block_codes`.
+    dedup : bool
+        Whether both datasets are the same.
+    coords1, coords2 : np.ndarray, optional
+        Geopositions (lat, lon) in radians, required if `max_distance` is
+        given.
+    fueltypes1, fueltypes2 : np.ndarray, optional
+        Integer codes of the fueltypes (-1 for missing values). If given,
+        only records with the same fueltype are paired, records without
+        fueltype are paired with all records of the block.
+    max_distance : float, optional
+        Maximal distance in meters between two records with geoposition.
+    names1, names2 : sp.csr_matrix, optional
+        Name vectors as returned by `name_vectors`, required if
+        `name_top_k` is given.
+    name_top_k : int, optional
+        Only pair records (without geoposition, if `max_distance` is given)
+        whose names are among the `name_top_k` most similar ones of the
+        block, see `name_pairs`.
+    """
+    if name_top_k is None:
+        pairs = block_pairs
+    else:
+
+        def pairs(b1, b2, dedup):
+            return name_pairs(b1, b2, dedup, names1, names2, name_top_k)
+
+    if fueltypes1 is None:
+        combinations = [(blocks1, blocks2)]
+    else:
+        n = max(fueltypes1.max(initial=0), fueltypes2.max(initial=0)) + 1
+        has1, has2 = fueltypes1 >= 0, fueltypes2 >= 0
+        combinations = [
+            # same fueltype
+            (
+                np.where(has1 & (blocks1 >= 0), blocks1 * n + fueltypes1, -1),
+                np.where(has2 & (blocks2 >= 0), blocks2 * n + fueltypes2, -1),
+            ),
+            # fueltype of the first record is missing
+            (np.where(has1, -1, blocks1), blocks2),
+            # fueltype of only the second record is missing
+            (np.where(has1, blocks1, -1), np.where(has2, -1, blocks2)),
+        ]
+
+    for b1, b2 in combinations:
+        if max_distance is None:
+            yield from pairs(b1, b2, dedup)
+        else:
+            yield from spatial_pairs(
+                b1, b2, coords1, coords2, max_distance, dedup, pairs
+            )
+
+
+def _prepare(
+    datasets, blocking, max_distance, fueltype_blocking, name_top_k, duke_config
+):
+    dedup = isinstance(datasets, pd.DataFrame)
+    if dedup:
+        datasets = [datasets, datasets]
+    if duke_config is None:
+        duke_config = "Deleteduplicates.xml" if dedup else "Comparison.xml"
+        duke_config = _package_data(duke_config)
+    config = read_duke_config(duke_config)
+
+    df1, df2 = datasets
+    if dedup:
+        (values1,), vocabs = encode([df1], config)
+        values2 = values1
+    else:
+        (values1, values2), vocabs = encode([df1, df2], config)
+
+    blocks1, blocks2 = block_codes([df1, df2], blocking)
+    kwargs = dict(max_distance=max_distance)
+    if max_distance is not None:
+        kwargs.update(
+            coords1=np.radians(df1[["lat", "lon"]].to_numpy(dtype=float)),
+            coords2=np.radians(df2[["lat", "lon"]].to_numpy(dtype=float)),
+        )
+    if fueltype_blocking:
+        fueltypes, _ = pd.factorize(
+            np.concatenate([_string_values(df, "Fueltype", True) for df in (df1, df2)])
+        )
+        kwargs.update(
+            fueltypes1=fueltypes[: len(df1)], fueltypes2=fueltypes[len(df1) :]
+        )
+
+    if name_top_k is not None:
+        names = [_string_values(df, "Name", True) for df in (df1, df2)]
+        if dedup:
+            (names1,) = name_vectors(names[:1])
+            names2 = names1
+        else:
+            names1, names2 = name_vectors(names)
+        kwargs.update(names1=names1, names2=names2, name_top_k=name_top_k)
+
+    candidates = candidate_pairs(blocks1, blocks2, dedup, **kwargs)
+    return dedup, df1, df2, config, values1, values2, vocabs, candidates
+
+
+def duke_native(
+    datasets,
+    labels=["one", "two"],
+    singlematch=False,
+    blocking=None,
+    max_distance=None,
+    fueltype_blocking=False,
+    name_top_k=None,
+    duke_config=None,
+    similarities=None,
+):
+    """
+    Run the native matching engine in deduplication or record linkage mode.
+
+    The arguments and the return value are the same as for
+    `powerplantmatching.duke.duke`.
+
+    Parameters
+    ----------
+    datasets : pd.DataFrame or [pd.DataFrame]
+        A single dataframe is run in deduplication mode, while multiple ones
+        are linked
+    labels : [str], default ['one', 'two']
+        Labels for the linked dataframe
+    singlematch: boolean, default False
+        Only in Record Linkage Mode. Only report the best match for each entry
+        of the first named dataset.
+    blocking : str or list, default None
+        Column(s) used as hard blocking key. Only records with identical
+        values in these columns are compared.
+    max_distance : float, default None
+        If given, records which both have a geoposition are only compared if
+        they are at most `max_distance` meters apart. Note that this might
+        drop matches duke would find, as a large distance does not rule out
+        a match.
+    fueltype_blocking : bool, default False
+        Whether to compare only records with the same fueltype. Records
+        without fueltype are compared with all records.
+    name_top_k : int, default None
+        If given, records are only compared with the `name_top_k` records
+        of the block with the most similar names (by the cosine similarity
+        of character trigram TF-IDF vectors) and vice versa. Records with
+        geoposition are still selected by `max_distance`, if given.
+    duke_config : str, default None
+        Path to the duke xml file, defaults to the package configuration of
+        the respective mode.
+    similarities : str, default None
+        Path of a Parquet file to store the similarities of all properties
+        for all candidate pairs in, see `write_similarities`. The pairs are
+        written chunk by chunk while they are scored.
+    """
+    dedup, df1, df2, config, values1, values2, vocabs, candidates = _prepare(
+        datasets, blocking, max_distance, fueltype_blocking, name_top_k, duke_config
+    )
+
+    res = []
+    ncandidates = 0
+    if similarities is None:
+        for i, j in candidates:
+            ncandidates += len(i)
+            res.append(score_pairs(values1, values2, vocabs, i, j, config))
+    else:
+        attrs = _similarity_attrs(config, dedup)
+        chunks = _similarity_chunks(values1, values2, vocabs, candidates, config)
+        chunks = _write_similarity_chunks(
+            similarities, chunks, labels, attrs, df1.index, df2.index
+        )
+        for i, j, sims in chunks:
+            ncandidates += len(i)
+            scores = _combine_similarities(sims, attrs["properties"])
+            keep = scores > config["threshold"]
+            res.append((i[keep], j[keep], scores[keep]))
+    logger.debug(f"Scored {ncandidates} candidate pairs")
+    if res:
+        i, j, scores = map(np.concatenate, zip(*res))
+    else:
+        i, j, scores = np.empty(0, int), np.empty(0, int), np.empty(0)
+
+    links = pd.DataFrame({"i": i, "j": j, "scores": scores})
+    links = links.sort_values(["i", "j"], kind="stable", ignore_index=True)
+    if singlematch and not dedup:
+        links = links.loc[links.groupby("i", sort=False)["scores"].idxmax()]
+
+    res = pd.DataFrame(
+        {
+            labels[0]: df1.index.to_numpy()[links.i.to_numpy()],
+            labels[1]: df2.index.to_numpy()[links.j.to_numpy()],
+        }
+    )
+    if dedup:
+        return res
+    return res.assign(scores=links.scores.to_numpy(dtype=float))
+
+
+def pair_similarities(
+    datasets,
+    labels=["one", "two"],
+    blocking=None,
+    max_distance=None,
+    fueltype_blocking=False,
+    name_top_k=None,
+    duke_config=None,
+):
+    """
+    Compute the similarities of all properties for all candidate pairs.
+
+    The resulting table allows to rescore the pairs with different
+    thresholds and probability bounds via `score_similarities` without
+    comparing the records again. The arguments are the same as for
+    `duke_native`. The table is built in memory, `duke_native(...,
+    similarities=fn)` writes the similarities chunk by chunk instead.
+
+    Returns
+    -------
+    pd.DataFrame
+        The index labels of the pairs in the columns `labels` and one column
+        per duke property with its similarity (NaN if a value is missing).
+        The threshold and the probability bounds of the duke configuration
+        and the mode are stored in the `attrs`.
+    """
+    dedup, df1, df2, config, values1, values2, vocabs, candidates = _prepare(
+        datasets, blocking, max_distance, fueltype_blocking, name_top_k, duke_config
+    )
+
+    chunks = [
+        pd.DataFrame({"i": i, "j": j, **sims})
+        for i, j, sims in _similarity_chunks(
+            values1, values2, vocabs, candidates, config
+        )
+    ]
+    columns = ["i", "j", *config["properties"]]
+    sims = pd.concat(chunks) if chunks else pd.DataFrame(columns=columns, dtype=float)
+    sims = sims.sort_values(["i", "j"], kind="stable", ignore_index=True)
+
+    sims = sims.assign(
+        i=df1.index.to_numpy()[sims.i.to_numpy(dtype=int)],
+        j=df2.index.to_numpy()[sims.j.to_numpy(dtype=int)],
+    ).rename(columns={"i": labels[0], "j": labels[1]})
+    sims.attrs = _similarity_attrs(config, dedup)
+    return sims
+
+
+def _similarity_attrs(config, dedup):
+    # threshold, probability bounds and mode needed to rescore similarities
+    return {
+        "threshold": config["threshold"],
+        "properties": {
+            name: {"low": prop["low"], "high": prop["high"]}
+            for name, prop in config["properties"].items()
+        },
+        "dedup": dedup,
+    }
+
+
+def _similarity_chunks(values1, values2, vocabs, candidates, config):
+    # similarities of all properties for each chunk of candidate pairs, other
+    # than in `score_pairs` no pair is skipped
+    for i, j in candidates:
+        sims = {
+            name: similarity(prop, values1[name][i], values2[name][j], vocabs.get(name))
+            for name, prop in config["properties"].items()
+        }
+        yield i, j, sims
+
+
+def _combine_similarities(sims, bounds, properties=None):
+    # the bayesian combination of `bayes` is a product of the odds
+    if properties is None:
+        properties = {}
+    odds = np.ones(len(next(iter(sims.values()))) if sims else 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for name, prop in bounds.items():
+            prop = {**prop, **properties.get(name, {})}
+            p = probability(
+                np.asarray(sims[name], dtype=float), prop["low"], prop["high"]
+            )
+            odds *= np.where(np.isnan(p), 1.0, p / (1 - p))
+        return np.nan_to_num(1 / (1 + 1 / odds))
+
+
+def similarity_scores(sims, properties=None):
+    """
+    Compute the match probabilities of the pairs of a table of similarities
+    as returned by `pair_similarities`. For sweeps over the threshold only,
+    the scores thus need to be computed once.
+
+    Parameters
+    ----------
+    sims : pd.DataFrame
+        Similarities as returned by `pair_similarities` or
+        `read_similarities`.
+    properties : dict, default None
+        Probability bounds overriding the ones of the duke configuration per
+        property, e.g. {"NAME": {"high": 0.95}}.
+    """
+    columns = {name: sims[name].to_numpy() for name in sims.attrs["properties"]}
+    return _combine_similarities(columns, sims.attrs["properties"], properties)
+
+
+def score_similarities(sims, threshold=None, properties=None, singlematch=False):
+    """
+    Score the pairs of a table of similarities as returned by
+    `pair_similarities` and return the links exceeding the threshold, in
+    the same format as `duke_native`.
+
+    Parameters
+    ----------
+    sims : pd.DataFrame
+        Similarities as returned by `pair_similarities` or
+        `read_similarities`.
+    threshold : float, default None
+        Threshold of the match probability, defaults to the one of the duke
+        configuration.
+    properties : dict, default None
+        Probability bounds overriding the ones of the duke configuration per
+        property, e.g. {"NAME": {"high": 0.95}}.
+    singlematch: boolean, default False
+        Only in Record Linkage Mode. Only report the best match for each entry
+        of the first dataset.
+    """
+    dedup = sims.attrs["dedup"]
+    if threshold is None:
+        threshold = sims.attrs["threshold"]
+    scores = similarity_scores(sims, properties)
+
+    labels = list(sims.columns[:2])
+    keep = scores > threshold
+    links = sims.loc[keep, labels].assign(scores=scores[keep])
+    if singlematch and not dedup:
+        links = links.loc[links.groupby(labels[0], sort=False)["scores"].idxmax()]
+    links = links.reset_index(drop=True)
+    if dedup:
+        return links[labels]
+    return links
+
+
+def _similarity_table(pairs1, pairs2, sims, labels, attrs):
+    import pyarrow as pa
+
+    columns = {labels[0]: pairs1, labels[1]: pairs2}
+    for name in attrs["properties"]:
+        columns[name] = np.asarray(sims[name], dtype="float32")
+    table = pa.table(columns)
+    return table.replace_schema_metadata({b"duke": json.dumps(attrs)})
+
+
+def _write_similarity_chunks(fn, chunks, labels, attrs, index1, index2):
+    # pass the chunks of `_similarity_chunks` on, after appending each one
+    # as row group to the Parquet file `fn`
+    import pyarrow.parquet as pq
+
+    index1, index2 = np.asarray(index1), np.asarray(index2)
+    writer = None
+    try:
+        for i, j, sims in chunks:
+            table = _similarity_table(index1[i], index2[j], sims, labels, attrs)
+            if writer is None:
+                writer = pq.ParquetWriter(fn, table.schema)
+            writer.write_table(table)
+            yield i, j, sims
+        if writer is None:
+            empty = dict.fromkeys(attrs["properties"], [])
+            table = _similarity_table(index1[:0], index2[:0], empty, labels, attrs)
+            pq.write_table(table, fn)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def similarities_file(directory, labels):
+    """
+    Return the path of the similarities of the comparison of the datasets
+    named `labels`, stored in `directory` by `duke(..., similarities=...)`.
+    """
+    return os.path.join(directory, f"{labels[0]}_{labels[1]}.parquet")
+
+
+def write_similarities(sims, fn):
+    """
+    Store a table of similarities as returned by `pair_similarities` in a
+    Parquet file. The pairs are stored by the index labels of both records
+    and the similarities in single precision.
+    """
+    import pyarrow.parquet as pq
+
+    labels = list(sims.columns[:2])
+    table = _similarity_table(
+        sims[labels[0]].to_numpy(), sims[labels[1]].to_numpy(), sims, labels, sims.attrs
+    )
+    pq.write_table(table, fn)
+
+
+def read_similarities(fn):
+    """
+    Read a table of similarities stored with `write_similarities` or by
+    `duke(..., similarities=...)`.
+    """
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(fn)
+    sims = table.to_pandas()
+    sims.attrs = json.loads(table.schema.metadata[b"duke"])
+    return sims
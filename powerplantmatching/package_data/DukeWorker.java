@@ -0,0 +1,62 @@
+// SPDX-FileCopyrightText: Contributors to powerplantmatching <https://github.com/pypsa/powerplantmatching>
+//
+// SPDX-License-Identifier: MIT
+
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+
+import no.priv.garshol.duke.Duke;
+
+/**
+ * Long-lived wrapper around the duke command line interface, used by
+ * powerplantmatching.duke.DukeWorker.
+ *
+ * Every line read from stdin holds the tab-separated command line arguments
+ * of one duke run. The output of the run is written to stdout with each
+ * line prefixed by "LOG\t", followed by a single line "DONE". The JVM and
+ * the duke classes are thus loaded only once for many runs.
+ *
+ * The compiled DukeWorker.class is shipped next to this file, rebuild it with
+ *   javac --release 8 -cp "duke_binaries/*" DukeWorker.java
+ */
+public class DukeWorker {
+    public static void main(String[] argv) throws IOException {
+        BufferedReader in = new BufferedReader(
+            new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        PrintStream out = new PrintStream(
+            new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        PrintStream err = System.err;
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty())
+                continue;
+
+            ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+            PrintStream capture = new PrintStream(buffer, true, "UTF-8");
+            System.setOut(capture);
+            System.setErr(capture);
+            try {
+                Duke.main(line.split("\t"));
+            } catch (Throwable e) {
+                capture.println("ERROR: " + e);
+                e.printStackTrace(capture);
+            }
+            capture.flush();
+            System.setOut(out);
+            System.setErr(err);
+
+            for (String l : buffer.toString("UTF-8").split("\n")) {
+                if (!l.isEmpty())
+                    out.println("LOG\t" + l);
+            }
+            out.println("DONE");
+        }
+    }
+}
@@ -6,25 +6,47 @@
 Utility functions for checking data completeness and supporting other functions
 """
 
+import atexit
+import functools
 import multiprocessing
 import os
 import re
 from ast import literal_eval as liteval
-from importlib.metadata import version
+from glob import escape as glob_escape
+from glob import glob
 
-import country_converter as coco
 import numpy as np
 import pandas as pd
 import pycountry as pyc
-import requests
 import six
 from numpy import atleast_1d
-from packaging.version import parse
 from tqdm import tqdm
 
 from .core import _data_in, _package_data, get_config, get_obj_if_Acc, logger
+from .download import download, download_many
 
-cc = coco.CountryConverter()
+
+@functools.cache
+def _country_converter():
+    import country_converter as coco
+
+    return coco.CountryConverter()
+
+
+@functools.cache
+def _country_map():
+    return pd.read_csv(_package_data("country_codes.csv")).replace(
+        {"name": {"Czechia": "Czech Republic"}}
+    )
+
+
+def __getattr__(name):
+    # the country converter and the country codes are only read when needed
+    if name == "cc":
+        return _country_converter()
+    if name == "country_map":
+        return _country_map()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def lookup(df, keys=None, by="Country, Fueltype", exclude=None, unit="MW"):
@@ -79,18 +101,132 @@ def get_raw_file(name, update=False, config=None, skip_retrieve=False):
     path = _data_in(df_config["fn"])
 
     if (not os.path.exists(path) or update) and not skip_retrieve:
-        url = df_config["url"]
-        logger.info(f"Retrieving data from {url}")
-        base_version = parse(version(__package__)).base_version
-        user_agent = f"{__package__}/{base_version}"
-        r = requests.get(url, headers={"User-Agent": user_agent}, timeout=60)
-        r.raise_for_status()
-        with open(path, "wb") as outfile:
-            outfile.write(r.content)
+        download(df_config["url"], path, update=update)
 
     return path
 
 
+def retrieve_raw_files(names, update=False, config=None):
+    """
+    Download the raw files of several data source configurations in
+    parallel, see `get_raw_file`. Configurations without an url are skipped.
+
+    Parameters
+    ----------
+    names : list
+        Names of the data source configurations, e.g. ["GEO", "GEO_units"].
+    update : bool, default False
+        Whether to update existing files, which are only downloaded again if
+        they have changed on the server.
+    config : dict, default None
+        Custom configuration, defaults to `get_config()`.
+    """
+    if config is None:
+        config = get_config()
+    files = {}
+    for name in names:
+        df_config = config.get(name)
+        if not isinstance(df_config, dict) or "url" not in df_config:
+            continue
+        path = _data_in(df_config["fn"])
+        if update or not os.path.exists(path):
+            files[path] = df_config["url"]
+    return download_many(
+        files, update=update, max_workers=config.get("download_workers", 8)
+    )
+
+
+def read_csv_chunked(fn, select=None, chunksize=500_000, **kwargs):
+    """
+    Read a csv file in chunks and keep only the rows selected in each chunk,
+    such that the peak memory is bounded by the chunk and the output size.
+
+    Parameters
+    ----------
+    fn : str or file-like
+        The csv file.
+    select : function, default None
+        Function returning the selected rows of a chunk, e.g. filtering by a
+        capacity threshold.
+    chunksize : int, default 500_000
+        Number of rows per chunk.
+    **kwargs
+        Keyword arguments of `pandas.read_csv`, e.g. `usecols` to read only
+        the needed columns.
+    """
+    chunks = []
+    with pd.read_csv(fn, chunksize=chunksize, **kwargs) as reader:
+        for chunk in reader:
+            chunks.append(chunk if select is None else select(chunk))
+    if not chunks:
+        return pd.DataFrame(columns=kwargs.get("usecols"))
+    return pd.concat(chunks)
+
+
+def read_excel_sheets(fn, sheets, required=True, **kwargs):
+    """
+    Read several sheets of an Excel workbook, which is opened only once.
+
+    Each sheet is stored as Parquet next to the workbook, keyed by the hash
+    of the workbook and the reading arguments. Later calls read the
+    columnar copies as long as the workbook does not change.
+
+    Parameters
+    ----------
+    fn : str
+        Path of the workbook.
+    sheets : list or dict
+        Names of the sheets to read, or a dictionary mapping the names to
+        keyword arguments of `pandas.read_excel` for the single sheets.
+    required : bool, default True
+        Whether to raise a ValueError if a sheet does not exist, otherwise
+        missing sheets are left out.
+    **kwargs
+        Keyword arguments of `pandas.read_excel` for all sheets.
+
+    Returns
+    -------
+    dict
+        The dataframes of the (existing) sheets by name.
+    """
+    from .cache import hash_file, hash_objects, read_cache, write_cache
+
+    if not isinstance(sheets, dict):
+        sheets = {sheet: {} for sheet in sheets}
+    digest = hash_file(fn)
+    base = os.path.splitext(fn)[0]
+
+    def converted(sheet):
+        key = hash_objects(digest, sheet, {**kwargs, **sheets[sheet]})
+        slug = re.sub(r"[^\w-]+", "_", sheet)
+        return f"{base}.{slug}.{key[:16]}"
+
+    res = {sheet: read_cache(converted(sheet)) for sheet in sheets}
+    # missing sheets are marked, so the workbook is not opened again
+    for sheet in [s for s, df in res.items() if df is None]:
+        if os.path.exists(converted(sheet) + ".missing") and not required:
+            del res[sheet]
+    todo = [sheet for sheet, df in res.items() if df is None]
+    if todo:
+        with pd.ExcelFile(fn) as excel:
+            for sheet in todo:
+                if sheet not in excel.sheet_names:
+                    if required:
+                        raise ValueError(f"Worksheet named '{sheet}' not found")
+                    del res[sheet]
+                else:
+                    res[sheet] = excel.parse(sheet, **{**kwargs, **sheets[sheet]})
+                # remove the conversions of former versions of the workbook
+                slug = re.sub(r"[^\w-]+", "_", sheet)
+                for old in glob(f"{glob_escape(base)}.{glob_escape(slug)}.*.*"):
+                    os.remove(old)
+                if sheet in res:
+                    write_cache(res[sheet], converted(sheet))
+                else:
+                    open(converted(sheet) + ".missing", "w").close()
+    return res
+
+
 def config_filter(df, config):
     """
     Convenience function to filter data source according to the config.yaml
@@ -300,11 +436,29 @@ def select_by_projectID(df, projectID, dataset_name=None):
         return df[df["projectID"].apply(lambda x: projectID in sum(x.values(), []))]
 
 
-def update_saved_matches_for_(name):
+def update_saved_matches_for_(name, config=None, **kwargs):
     """
-    Update your saved matched for a single source. This is very helpful if you
-    modified/updated a data source and do not want to run the whole matching
-    again.
+    Update the matched dataset after a single data source changed. This is
+    very helpful if you modified/updated a data source and do not want to
+    run the whole matching again.
+
+    Only the comparisons of the changed source with the other sources are
+    run again. The matches of all other pairs of sources and the
+    aggregations of the unchanged sources are read from the cache (see
+    `cache_matches` and `cache_aggregations` in the config), a ValueError is
+    raised if the matches of such a pair are not cached. The cross matches
+    and the reduced dataset are rebuilt from all matches and written to the
+    file read by `powerplants`.
+
+    Parameters
+    ----------
+    name : str
+        Name of the data source which changed.
+    config : dict, default None
+        Custom configuration, defaults to
+        `powerplantmatching.config.get_config()`.
+    **kwargs
+        Further arguments passed to `powerplantmatching.powerplants`.
 
     Example
     -------
@@ -313,17 +467,22 @@ def update_saved_matches_for_(name):
 
     >>> pm.utils.update_saved_matches_for_('ESE')
     ... <Wait for the update> ...
-    >>> pm.collection.matched_data(update=True)
+    >>> pm.powerplants()
 
-    Now the matched_data is updated with the modified version of ESE.
+    Now the matched data contains the modified version of ESE.
     """
-    from .collection import collect
-    from .matching import compare_two_datasets
+    from .collection import powerplants
+
+    if config is None:
+        config = get_config()
+
+    sources = [next(iter(to_dict_if_string(s))) for s in config["matching_sources"]]
+    if name not in sources:
+        raise ValueError(f"Data source '{name}' is not in the matching sources.")
+    logger.info(f"Updating the matched data for changes of data source '{name}'")
 
-    df = collect(name, use_saved_aggregation=False)
-    dfs = [ds for ds in get_config()["matching_sources"] if ds != name]
-    for to_match in dfs:
-        compare_two_datasets([collect(to_match), df], [to_match, name])
+    config = {**config, "cache_matches": True, "cache_aggregations": True}
+    return powerplants(config=config, update=True, changed=[name], **kwargs)
 
 
 def fun(f, q_in, q_out):
@@ -334,7 +493,21 @@ def fun(f, q_in, q_out):
         i, x = q_in.get()
         if i is None:
             break
-        q_out.put((i, f(x)))
+        try:
+            q_out.put((i, f(x), None))
+        except Exception as e:
+            q_out.put((i, None, e))
+
+
+def _process_count(config=None, threads=None):
+    if config is None:
+        config = get_config()
+
+    if threads is None:
+        threads = config["parallel_duke_processes"]
+    if isinstance(threads, bool):
+        threads = config.get("process_limit", 1)
+    return min(multiprocessing.cpu_count(), threads)
 
 
 def parmap(f, arg_list, config=None, threads=None):
@@ -355,16 +528,9 @@ def parmap(f, arg_list, config=None, threads=None):
     threads : int, default None
         number of parallel threads
     """
-    if config is None:
-        config = get_config()
-
-    if threads is None:
-        threads = config["parallel_duke_processes"]
-    if isinstance(threads, bool):
-        threads = config.get("process_limit", 1)
+    nprocs = _process_count(config, threads)
 
-    if threads > 1:
-        nprocs = min(multiprocessing.cpu_count(), threads)
+    if nprocs > 1:
         logger.info(f"Run process with {nprocs} parallel threads.")
         q_in = multiprocessing.Queue(1)
         q_out = multiprocessing.Queue()
@@ -383,14 +549,173 @@ def parmap(f, arg_list, config=None, threads=None):
 
         [p.join() for p in proc]
 
-        return [x for i, x in sorted(res)]
+        res = sorted(res, key=lambda r: r[0])
+        for _, _, e in res:
+            if e is not None:
+                raise e
+        return [x for _, x, _ in res]
     else:
         return list(map(f, arg_list))
 
 
-country_map = pd.read_csv(_package_data("country_codes.csv")).replace(
-    {"name": {"Czechia": "Czech Republic"}}
-)
+# frames shared with the worker processes of parmap_frames, either the
+# frames themselves or the paths of their Arrow IPC files
+_shared_frames: dict = {}
+_shared_files: dict = {}
+
+# process pool of parmap_frames, created on first use and kept for all calls,
+# with the directory for the Arrow IPC files and the owning process id and
+# number of workers
+_executor = None
+_executor_dir = None
+_executor_key = None
+
+
+def _attach_frames(frames):
+    _shared_frames.clear()
+    _shared_frames.update(frames)
+
+
+def _call_with_frames(f, files, arg):
+    # the workers are reused across calls of parmap_frames, the frames are
+    # only attached again if the calling parmap_frames changed
+    if files != _shared_files:
+        _attach_frames(files)
+        _shared_files.clear()
+        _shared_files.update(files)
+    return f(arg)
+
+
+def shared_frame(key):
+    """
+    Return a frame passed to `parmap_frames` within the mapped function.
+    In worker processes, the frame is memory mapped from its Arrow IPC file
+    on first access. Columns without missing values are then read-only
+    views on the mapped file.
+    """
+    frame = _shared_frames[key]
+    if isinstance(frame, str):
+        import pyarrow as pa
+
+        with pa.memory_map(frame) as source:
+            table = pa.ipc.open_file(source).read_all()
+        # split blocks avoid the copy of consolidating the columns
+        frame = table.to_pandas(split_blocks=True)
+        _shared_frames[key] = frame
+    return frame
+
+
+def _shutdown_executor():
+    global _executor, _executor_dir
+    import shutil
+
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+    if _executor_dir is not None:
+        shutil.rmtree(_executor_dir, ignore_errors=True)
+        _executor_dir = None
+
+
+def _get_executor(nprocs):
+    """
+    Return the process pool of `parmap_frames` with `nprocs` workers and
+    the directory for the Arrow IPC files of its calls. The pool is created
+    on first use, recreated if the number of workers changes or in a forked
+    process, and shut down at exit.
+    """
+    global _executor, _executor_dir, _executor_key
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    key = (os.getpid(), nprocs)
+    if _executor is not None and _executor_key != key:
+        # a forked process must not use the workers of its parent
+        if _executor_key[0] == key[0]:
+            _shutdown_executor()
+        _executor = _executor_dir = None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(nprocs)
+        _executor_dir = tempfile.mkdtemp()
+        _executor_key = key
+        atexit.unregister(_shutdown_executor)
+        atexit.register(_shutdown_executor)
+    return _executor, _executor_dir
+
+
+def parmap_frames(f, frames, arg_list, costs=None, config=None, threads=None):
+    """
+    Parallel mapping function for functions operating on a common set of
+    dataframes. The frames are written once to Arrow IPC files, which are
+    memory mapped by a pool of worker processes, such that only the
+    arguments in `arg_list` are sent to the workers. Within `f`, the frames
+    are accessed via `shared_frame(key)`, where key is the position in
+    `frames`, and must not be modified in place. Exceptions of `f` are
+    raised in the calling process. The pool of worker processes is kept for
+    subsequent calls.
+
+    Parameters
+    ----------
+    f : function
+        module-level python function with one argument
+    frames : list of pandas.DataFrame
+        frames accessed by `f`, must be convertible to Arrow tables
+    arg_list : list
+        list of arguments mapped to f
+    costs : list of float, default None
+        expected costs of the arguments, the most expensive ones are
+        scheduled first
+    config : dict, default None
+        configuration dictionary
+    threads : int, default None
+        number of parallel processes
+    """
+    nprocs = _process_count(config, threads)
+
+    if nprocs <= 1:
+        _attach_frames(dict(enumerate(frames)))
+        try:
+            return list(map(f, arg_list))
+        finally:
+            _shared_frames.clear()
+
+    import shutil
+    import tempfile
+    from concurrent.futures.process import BrokenProcessPool
+
+    import pyarrow as pa
+
+    executor, directory = _get_executor(nprocs)
+    tmpdir = tempfile.mkdtemp(dir=directory)
+    try:
+        files = {}
+        for key, df in enumerate(frames):
+            files[key] = os.path.join(tmpdir, f"{key}.arrow")
+            table = pa.Table.from_pandas(df)
+            with pa.OSFile(files[key], "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+        order = range(len(arg_list))
+        if costs is not None:
+            order = np.argsort(-np.asarray(costs, dtype=float), kind="stable")
+
+        logger.info(f"Run process with {nprocs} parallel processes.")
+        futures = {
+            i: executor.submit(_call_with_frames, f, files, arg_list[i]) for i in order
+        }
+        try:
+            return [futures[i].result() for i in range(len(arg_list))]
+        except BrokenProcessPool:
+            _shutdown_executor()
+            raise
+        finally:
+            for future in futures.values():
+                future.cancel()
+    finally:
+        # the files may still be mapped by the workers on Windows, they are
+        # then removed at exit
+        shutil.rmtree(tmpdir, ignore_errors=True)
 
 
 def country_alpha2(country):
@@ -417,7 +742,9 @@ def convert_to_short_name(df):
     countries = df.Country.dropna().unique()
 
     kwargs = dict(to="name_short", not_found=None)
-    short_name = dict(zip(countries, atleast_1d(cc.convert(countries, **kwargs))))
+    short_name = dict(
+        zip(countries, atleast_1d(_country_converter().convert(countries, **kwargs)))
+    )
 
     return df.assign(Country=df.Country.replace(short_name))
 
@@ -426,7 +753,9 @@ def convert_country_to_alpha2(df):
     df = get_obj_if_Acc(df)
     countries = df.Country.dropna().unique()
     kwargs = dict(to="iso2", not_found=None)
-    iso2 = dict(zip(countries, atleast_1d(cc.convert(countries, **kwargs))))
+    iso2 = dict(
+        zip(countries, atleast_1d(_country_converter().convert(countries, **kwargs)))
+    )
 
     return df.assign(Country=df.Country.replace(iso2).where(lambda ds: ds != "nan"))
 
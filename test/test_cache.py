@@ -0,0 +1,360 @@
+# SPDX-FileCopyrightText: Contributors to powerplantmatching <https://github.com/pypsa/powerplantmatching>
+#
+# SPDX-License-Identifier: MIT
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from powerplantmatching import cache, data, matching
+from powerplantmatching.cache import (
+    cached_loader,
+    changeset,
+    hash_frame,
+    read_cache,
+    row_hashes,
+    write_cache,
+)
+from powerplantmatching.cleaning import clean_name
+from powerplantmatching.collection import collect, powerplants
+from powerplantmatching.core import _data_in, get_config, package_config
+from powerplantmatching.matching import compare_two_datasets, link_multiple_datasets
+from powerplantmatching.utils import read_csv_chunked, read_excel_sheets
+
+TEST_DATA = {
+    "Name": ["Aarauerstrasse", "Aarberg", "Aarwangen", "Abbey Mills", "Abertay"],
+    "Fueltype": ["Hydro", "Hydro", "Hydro", "Other", "Other"],
+    "Technology": ["Run-Of-River", "Run-Of-River", None, None, None],
+    "Country": ["Switzerland"] * 3 + ["United Kingdom"] * 2,
+    "Capacity": [0.2, 14.5, 11.0, 1.0, 1.9],
+    "lat": [47.3, 47.0, 47.2, 51.5, 56.5],
+    "lon": [8.0, 7.3, 7.8, -0.0, -2.9],
+}
+
+
+def test_cache_roundtrip(tmp_path):
+    df = pd.DataFrame(TEST_DATA).assign(
+        projectID=[{"a"}, {"b", "c"}, {"d"}, set(), {"e"}]
+    )
+    fn = str(tmp_path / "entry")
+
+    assert read_cache(fn) is None
+    write_cache(df, fn)
+    pd.testing.assert_frame_equal(read_cache(fn), df)
+    assert hash_frame(read_cache(fn)) == hash_frame(df)
+
+    # mixed types cannot be stored in parquet
+    df = df.assign(DateIn=[1990, "1995", np.nan, 2000.0, None])
+    write_cache(df, fn + "_mixed")
+    pd.testing.assert_frame_equal(read_cache(fn + "_mixed"), df)
+
+
+def test_hash_frame():
+    df = pd.DataFrame(TEST_DATA)
+    assert hash_frame(df) == hash_frame(df.copy())
+    assert hash_frame(df) != hash_frame(df.assign(Capacity=df.Capacity + 1))
+    assert hash_frame(df) != hash_frame(df.set_axis(df.index + 1))
+
+
+def test_changeset():
+    old = pd.DataFrame(TEST_DATA).assign(projectID=["a", "b", "c", "d", "d"])
+    new = old.iloc[1:].assign(Capacity=[14.5, 12.0, 1.0, 1.9], projectID=list("bcdd"))
+    new = pd.concat([new, old.iloc[:1].assign(projectID="e")])
+
+    changes = changeset(old, new)
+    assert list(changes["added"]) == ["e"]
+    assert list(changes["removed"]) == ["a"]
+    assert list(changes["changed"]) == ["c"]
+    # repeated keys are compared in order of appearance
+    assert list(row_hashes(new).index) == ["b", "c", "d", "d#1", "e"]
+    assert changeset(row_hashes(old), old)["changed"].empty
+
+
+def test_cached_loader(monkeypatch, tmp_path):
+    monkeypatch.setitem(package_config, "data_dir", tmp_path)
+    os.makedirs(tmp_path / "data" / "in")
+    pd.DataFrame(TEST_DATA).to_csv(_data_in("fake.csv"), index=False)
+    calls = []
+
+    @cached_loader
+    def FAKE(raw=False, update=False, config=None):
+        calls.append(raw)
+        df = pd.read_csv(_data_in(config["FAKE"]["fn"]))
+        if raw:
+            return df
+        df = df[df.Country.isin(config["target_countries"])]
+        df.columns.name = "FAKE"
+        return df
+
+    config = get_config(FAKE={"fn": "fake.csv"})
+    df = FAKE(config=config)
+    cached = FAKE(config=config)
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(cached, df)
+    assert cached.columns.name == "FAKE"
+
+    # config entries which are not read by the loader do not matter
+    FAKE(config={**config, "main_query": "Capacity > 1"})
+    assert len(calls) == 1
+    FAKE(config={**config, "target_countries": ["Switzerland"]})
+    assert len(calls) == 2
+
+    pd.DataFrame(TEST_DATA).iloc[:2].to_csv(_data_in("fake.csv"), index=False)
+    assert len(FAKE(config=config)) == 2
+    assert len(calls) == 3
+
+    FAKE(raw=True, config=config)
+    FAKE(raw=True, config=config)
+    assert len(calls) == 5
+
+
+def test_cached_loader_clean_name(monkeypatch, tmp_path):
+    monkeypatch.setitem(package_config, "data_dir", tmp_path)
+    os.makedirs(tmp_path / "data" / "in")
+    raw = {
+        "Name": ["Kraftwerk Nord Power Station"],
+        "Net performance MW": [1000.0],
+        "country": ["Germany"],
+        "Status": ["in Betrieb"],
+        "decommission_year": [2030],
+        "commission_year": [1980],
+    }
+    pd.DataFrame(raw).to_csv(_data_in(get_config()["WIKIPEDIA"]["fn"]))
+
+    config = get_config(cache_sources=True)
+    assert data.WIKIPEDIA(config=config).Name.tolist() == ["Nord"]
+
+    # the config of clean_name is read by the loader and part of the key
+    config["clean_name"] = {**config["clean_name"], "replace": {"": ["nord"]}}
+    plants = pd.DataFrame({"Name": raw["Name"], "Fueltype": "Nuclear"})
+    expected = clean_name(plants, config=config).Name.tolist()
+    assert expected == ["Kraftwerk Power Station"]
+    assert data.WIKIPEDIA(config=config).Name.tolist() == expected
+
+
+def test_code_version_package_data(monkeypatch):
+    hashed = []
+    monkeypatch.setattr(cache, "hash_file", lambda fn: hashed.append(fn) or fn)
+    cache.code_version.__wrapped__()
+    names = {os.path.basename(fn) for fn in hashed}
+    assert {"data.py", "country_codes.csv", "manual_corrections.csv"} <= names
+
+
+def test_read_excel_sheets(tmp_path):
+    fn = str(tmp_path / "tracker.xlsx")
+    data = pd.DataFrame(TEST_DATA).assign(Status=["operating", 2020, "--", None, 1])
+    with pd.ExcelWriter(fn) as writer:
+        data.to_excel(writer, sheet_name="Data", index=False)
+        data.iloc[:2].to_excel(writer, sheet_name="Below Threshold", index=False)
+
+    sheets = read_excel_sheets(fn, ["Data", "Below Threshold"], na_values=["--"])
+    expected = pd.read_excel(fn, sheet_name="Data", na_values=["--"])
+    pd.testing.assert_frame_equal(sheets["Data"], expected)
+    assert len(sheets["Below Threshold"]) == 2
+
+    # later calls read the columnar copies
+    converted = sorted(os.listdir(tmp_path))
+    assert len(converted) == 3
+    cached = read_excel_sheets(fn, ["Data", "Below Threshold"], na_values=["--"])
+    pd.testing.assert_frame_equal(cached["Data"], expected)
+    assert sorted(os.listdir(tmp_path)) == converted
+
+    sheets = read_excel_sheets(
+        fn, {"Data": dict(usecols=["Name"]), "Units": {}}, required=False
+    )
+    assert list(sheets) == ["Data"]
+    assert list(sheets["Data"].columns) == ["Name"]
+    with pytest.raises(ValueError):
+        read_excel_sheets(fn, ["Units"])
+
+
+def test_read_csv_chunked(tmp_path):
+    fn = tmp_path / "units.csv"
+    pd.DataFrame(TEST_DATA).to_csv(fn, index=False)
+
+    def select(chunk):
+        return chunk[chunk.Capacity >= 1]
+
+    df = read_csv_chunked(fn, select, chunksize=2, usecols=["Name", "Capacity"])
+    expected = pd.read_csv(fn, usecols=["Name", "Capacity"]).pipe(select)
+    pd.testing.assert_frame_equal(df, expected)
+
+    empty = read_csv_chunked(fn, lambda chunk: chunk.iloc[:0], chunksize=2)
+    assert empty.empty and list(empty.columns) == list(TEST_DATA)
+
+
+def test_cached_matches(caplog):
+    config = get_config(duke_engine="native", cache_matches=True)
+    df1 = pd.DataFrame(TEST_DATA)
+    df2 = df1.assign(Capacity=df1.Capacity * 1.01).iloc[::-1]
+
+    matches = compare_two_datasets([df1, df2], ["one", "two"], config=config)
+    with caplog.at_level("INFO", logger="powerplantmatching.matching"):
+        cached = compare_two_datasets([df1, df2], ["one", "two"], config=config)
+
+    assert "Reusing cached matches" in caplog.text
+
+    pd.testing.assert_frame_equal(cached, matches)
+    assert len(matches) == len(df1)
+
+
+def test_cached_aggregation(monkeypatch, caplog, tmp_path):
+    from powerplantmatching import collection, data
+
+    monkeypatch.setitem(package_config, "data_dir", tmp_path)
+    config = get_config(duke_engine="native", cache_aggregations=True)
+    df = pd.concat([pd.DataFrame(TEST_DATA)] * 2, ignore_index=True)
+    df = df.assign(projectID=[f"JRC{i}" for i in df.index]).reindex(
+        columns=config["target_columns"]
+    )
+    monkeypatch.setattr(data, "JRC", lambda config: df)
+
+    aggregated = collect("JRC", config=config)
+    with caplog.at_level("INFO", logger="powerplantmatching.collection"):
+        cached = collect("JRC", config=config)
+
+    assert "Reusing cached aggregation" in caplog.text
+    # sets of missing EIC values are restored as {nan}
+    pd.testing.assert_frame_equal(
+        cached.drop(columns="EIC"), aggregated.drop(columns="EIC")
+    )
+    assert hash_frame(cached) == hash_frame(aggregated)
+    assert cached.columns.name == "JRC"
+    assert len(aggregated) < len(df)
+
+    # only the countries with changed units are aggregated again
+    aggregate = collection.aggregate_units
+    aggregated_countries = []
+
+    def aggregate_units(df, **kwargs):
+        aggregated_countries.extend(df.Country.unique())
+        return aggregate(df, **kwargs)
+
+    monkeypatch.setattr(collection, "aggregate_units", aggregate_units)
+    df.loc[3, "Capacity"] = 2.0
+    with caplog.at_level("INFO", logger="powerplantmatching.collection"):
+        updated = collect("JRC", config=config)
+    assert aggregated_countries == ["United Kingdom"]
+    assert "1 changed rows" in caplog.text
+    expected = collect("JRC", config={**config, "cache_aggregations": False})
+    pd.testing.assert_frame_equal(
+        updated.drop(columns="EIC").sort_values("Name", ignore_index=True),
+        expected.drop(columns="EIC").sort_values("Name", ignore_index=True),
+    )
+
+
+def test_cached_country_matches(monkeypatch, tmp_path):
+    monkeypatch.setitem(package_config, "data_dir", tmp_path)
+    config = get_config(duke_engine="native", cache_matches=True)
+    df1 = pd.DataFrame(TEST_DATA)
+    df2 = df1.assign(Capacity=df1.Capacity * 1.01).iloc[::-1]
+    compare_two_datasets([df1, df2], ["one", "two"], config=config)
+
+    linked = []
+    duke = matching.duke
+    monkeypatch.setattr(
+        matching,
+        "duke",
+        lambda dfs, *args, **kwargs: (
+            linked.extend(dfs[0].Country.unique()) or duke(dfs, *args, **kwargs)
+        ),
+    )
+
+    # a changed entry (with a shifted index) only affects its country
+    df2 = pd.concat([df2.iloc[:1].assign(Name="Abertay Mill"), df2.iloc[1:]])
+    df2.index += 10
+    output = compare_two_datasets([df1, df2], ["one", "two"], config=config)
+    assert linked == ["United Kingdom"]
+
+    expected = compare_two_datasets(
+        [df1, df2], ["one", "two"], config={**config, "cache_matches": False}
+    )
+    pd.testing.assert_frame_equal(
+        output.sort_values("one", ignore_index=True),
+        expected.sort_values("one", ignore_index=True),
+    )
+    assert len(output) == len(df1)
+
+    # the matches of a country do not depend on the other target countries
+    linked.clear()
+    config = {**config, "target_countries": ["Switzerland", "United Kingdom"]}
+    compare_two_datasets([df1, df2], ["one", "two"], config=config)
+    assert linked == []
+
+
+def test_cached_link_multiple_datasets(monkeypatch, tmp_path):
+    monkeypatch.setitem(package_config, "data_dir", tmp_path)
+    config = get_config(duke_engine="native", cache_matches=True)
+    dfs = []
+    for name, factor in [("A", 1.0), ("B", 1.01), ("C", 0.99)]:
+        df = pd.DataFrame(TEST_DATA).assign(Capacity=lambda df: df.Capacity * factor)
+        df.columns.name = name
+        dfs.append(df)
+    expected = link_multiple_datasets(dfs, ["A", "B", "C"], config=config)
+
+    compared = []
+    compare = matching._compare_shared
+    monkeypatch.setattr(
+        matching,
+        "_compare_shared",
+        lambda args: compared.append(args[1]) or compare(args),
+    )
+
+    # only the comparisons of a changed source are run again
+    dfs[2] = (
+        dfs[2]
+        .assign(Name=dfs[2].Name.str.upper())
+        .pipe(lambda df: df.rename_axis(columns="C"))
+    )
+    output = link_multiple_datasets(dfs, ["A", "B", "C"], config=config)
+    assert compared == [["A", "C"], ["B", "C"]]
+    pd.testing.assert_frame_equal(output, expected)
+
+
+def test_update_saved_matches_for_(monkeypatch, tmp_path):
+    from powerplantmatching import collection
+    from powerplantmatching.utils import update_saved_matches_for_
+
+    monkeypatch.setitem(package_config, "data_dir", tmp_path)
+    monkeypatch.setattr(collection, "retrieve_raw_files", lambda *a, **k: None)
+    config = get_config(
+        duke_engine="native",
+        matching_sources=["GEO", "JRC", "OPSD"],
+        fully_included_sources=[],
+    )
+    sources = {}
+    for name, factor in [("GEO", 1.0), ("JRC", 1.01), ("OPSD", 0.99)]:
+        df = pd.DataFrame(TEST_DATA).assign(
+            Capacity=lambda df: df.Capacity * factor,
+            projectID=[f"{name}{i}" for i in range(5)],
+        )
+        sources[name] = df.reindex(columns=config["target_columns"])
+        monkeypatch.setattr(data, name, lambda config, name=name: sources[name])
+    kwargs = dict(config=config, fill_geopositions=False)
+    powerplants(update=True, **kwargs)
+
+    compared = []
+    compare = matching._compare_shared
+    monkeypatch.setattr(
+        matching,
+        "_compare_shared",
+        lambda args: compared.append(args[1]) or compare(args),
+    )
+    sources["JRC"] = sources["JRC"].assign(Name=lambda df: df.Name.str.upper())
+    updated = update_saved_matches_for_("JRC", **kwargs)
+    assert compared == [["GEO", "JRC"], ["JRC", "OPSD"]]
+    assert powerplants(**kwargs).Name.tolist() == updated.Name.tolist()
+
+    expected = powerplants(
+        update=True,
+        config={**config, "cache_matches": False},
+        fill_geopositions=False,
+    )
+    pd.testing.assert_frame_equal(updated, expected)
+
+    # the matches of the unchanged pairs have to be cached
+    sources["GEO"] = sources["GEO"].assign(Capacity=lambda df: df.Capacity + 1)
+    with pytest.raises(ValueError, match="No cached matches of `GEO` and `OPSD`"):
+        update_saved_matches_for_("JRC", **kwargs)
@@ -2,15 +2,21 @@
 #
 # SPDX-License-Identifier: MIT
 
+import networkx as nx
 import numpy as np
 import pandas as pd
 import pytest
 
+from powerplantmatching import cleaning
 from powerplantmatching.cleaning import (
+    aggregate_units,
     clean_name,
+    cliques,
+    exact_duplicates,
     gather_and_replace,
     gather_specifications,
 )
+from powerplantmatching.core import get_config
 
 TEST_DATA = {
     "Name": [
@@ -87,3 +93,118 @@ def test_clean_name(data):
     assert res.Name[2] == "Another Powerplant With Whitespaces"
     assert res.Name[3] == "Coalition"
     assert res.Name[4] == "Besonders Chp"
+
+
+def test_cliques():
+    df = pd.DataFrame({"Name": list("abcdef")}, index=range(10, 16))
+    # a-b-c form a clique, d is linked to c only, e-f is not reciprocal
+    links = [(10, 11), (10, 12), (11, 12), (12, 13), (14, 15)]
+    duplicates = pd.DataFrame(links + [(j, i) for i, j in links[:-1]])
+    duplicates.columns = ["one", "two"]
+
+    # c is in the cliques a-b-c and c-d and assigned to the last one found
+    grouped = cliques(df, duplicates).grouped
+    assert grouped[10] == grouped[11] != grouped[13]
+    assert grouped[12] == grouped[13]
+    assert grouped[14] != grouped[15]
+    assert grouped.nunique() == 4
+
+    grouped = cliques(df, duplicates, grouping="components").grouped
+    assert grouped[10] == grouped[11] == grouped[12] == grouped[13]
+    assert grouped.nunique() == 3
+
+
+def cliques_networkx(df, dataduplicates):
+    # the former implementation assigning clique by clique
+    G = nx.DiGraph()
+    G.add_nodes_from(df.index)
+    G.add_edges_from((r.one, r.two) for r in dataduplicates.itertuples())
+    H = G.to_undirected(reciprocal=True)
+
+    grouped = pd.Series(np.nan, index=df.index)
+    for i, inds in enumerate(nx.algorithms.clique.find_cliques(H)):
+        grouped.loc[inds] = i
+    return df.assign(grouped=grouped)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_cliques_overlapping(seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"Name": "x"}, index=rng.permutation(200) + 1000)
+    # dense random links between few units yield many overlapping cliques
+    links = rng.choice(df.index, size=(600, 2)) // 4 * 4
+    links = links + rng.integers(0, 4, size=links.shape)
+    links = np.vstack([links, links[: len(links) // 2, ::-1]])
+    duplicates = pd.DataFrame(links, columns=["one", "two"])
+
+    expected = cliques_networkx(df, duplicates)
+    pd.testing.assert_frame_equal(cliques(df, duplicates), expected)
+
+
+def test_aggregate_units_exact_duplicates(monkeypatch):
+    config = get_config(duke_engine="native", collapse_exact_duplicates=True)
+    units = pd.DataFrame(
+        {
+            "Name": ["Plant", "Plant", "Plant", "Plant 2", "", ""],
+            "Fueltype": ["Hydro"] * 6,
+            "Country": ["Switzerland"] * 6,
+            "Capacity": [10.0, 10.0, 10.0, 12.0, 5.0, 5.0],
+            "lat": [47.0] * 6,
+            "lon": [8.0] * 6,
+            "projectID": [f"U{i}" for i in range(6)],
+        }
+    ).reindex(columns=config["target_columns"])
+
+    # units without name are not linked with each other
+    representative = exact_duplicates(units.fillna({"Name": ""}))
+    assert representative.tolist() == [0, 0, 0, 3, 4, 5]
+
+    output = aggregate_units(units, dataset_name="TEST", config=config)
+    monkeypatch.setattr(
+        cleaning, "exact_duplicates", lambda df, *args: pd.Series(df.index, df.index)
+    )
+    expected = aggregate_units(units, dataset_name="TEST", config=config)
+
+    pd.testing.assert_frame_equal(
+        output.drop(columns="EIC"), expected.drop(columns="EIC")
+    )
+
+
+def test_aggregate_units_per_country(monkeypatch):
+    config = get_config(duke_engine="java")
+    rng = np.random.default_rng(0)
+    n = 80
+    units = pd.DataFrame(
+        {
+            "Name": rng.choice(["Nord Hydro", "Nord Park", "Alpen Hydro"], n),
+            "Fueltype": rng.choice(["Hydro", "Wind"], n),
+            "Country": rng.choice(["Switzerland", "Austria", "France"], n),
+            "Capacity": rng.choice([1.0, 2.5, 10.0], n),
+            "lat": np.round(rng.normal(47, 0.001, n), 3),
+            "lon": np.round(rng.normal(8, 0.01, n), 3),
+            "projectID": [f"U{i}" for i in range(n)],
+            "EIC": [f"E{i}" for i in range(n)],
+        }
+    ).reindex(columns=config["target_columns"])
+    # injected duplicates and a shuffled index
+    units = pd.concat([units, units.sample(40, replace=True, random_state=0)])
+    units = units.sample(frac=1, random_state=1).set_axis(rng.permutation(10 * n)[:120])
+
+    output = aggregate_units(units, dataset_name="TEST", config=config)
+
+    # the former implementation ran duke once per country and assigned the
+    # cliques one by one
+    duke = cleaning.duke
+
+    def duke_per_country(df, blocking=None, **kwargs):
+        assert blocking == "Country"
+        links = [duke(df[df.Country == c], **kwargs) for c in df.Country.unique()]
+        return pd.concat(links)
+
+    monkeypatch.setattr(cleaning, "duke", duke_per_country)
+    monkeypatch.setattr(
+        cleaning, "cliques", lambda df, d, **kw: cliques_networkx(df, d)
+    )
+    expected = aggregate_units(units, dataset_name="TEST", config=config)
+
+    pd.testing.assert_frame_equal(output, expected)
@@ -0,0 +1,140 @@
+# SPDX-FileCopyrightText: Contributors to powerplantmatching <https://github.com/pypsa/powerplantmatching>
+#
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from powerplantmatching.core import get_config, package_config
+from powerplantmatching.download import download, download_many
+from powerplantmatching.utils import get_raw_file, retrieve_raw_files
+
+
+@pytest.fixture
+def server():
+    """
+    Local stand-in for the data servers, serving the files of `files` with
+    an ETag and answering conditional requests.
+    """
+    files = {}
+    requests_made = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_made.append((self.path, self.headers.get("If-None-Match")))
+            if self.path not in files:
+                self.send_error(404)
+                return
+            content = files[self.path]
+            etag = f'"{hashlib.sha1(content).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.files = files
+    httpd.requests = requests_made
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download(server, tmp_path):
+    server.files["/data.csv"] = b"a,b\n1,2\n"
+    url = server.url + "/data.csv"
+    fn = str(tmp_path / "data.csv")
+
+    download(url, fn)
+    with open(fn, "rb") as f:
+        assert f.read() == b"a,b\n1,2\n"
+    assert os.path.exists(fn + ".http.json")
+
+    # existing files are not requested again without update
+    download(url, fn)
+    assert len(server.requests) == 1
+
+    # unchanged files are not transferred again
+    mtime = os.stat(fn).st_mtime_ns
+    download(url, fn, update=True)
+    assert server.requests[-1][1] is not None
+    assert os.stat(fn).st_mtime_ns == mtime
+    with open(fn, "rb") as f:
+        assert f.read() == b"a,b\n1,2\n"
+
+    server.files["/data.csv"] = b"a,b\n3,4\n"
+    download(url, fn, update=True)
+    with open(fn, "rb") as f:
+        assert f.read() == b"a,b\n3,4\n"
+
+    # local changes of the file invalidate the stored validators
+    with open(fn, "wb") as f:
+        f.write(b"local")
+    download(url, fn, update=True)
+    assert server.requests[-1][1] is None
+    with open(fn, "rb") as f:
+        assert f.read() == b"a,b\n3,4\n"
+
+    # failed downloads leave the existing file untouched
+    with pytest.raises(requests.HTTPError):
+        download(server.url + "/missing.csv", fn, update=True)
+    with open(fn, "rb") as f:
+        assert f.read() == b"a,b\n3,4\n"
+    assert sorted(os.listdir(tmp_path)) == ["data.csv", "data.csv.http.json"]
+
+
+def test_download_many(server, tmp_path):
+    files = {}
+    for i in range(5):
+        server.files[f"/{i}.csv"] = str(i).encode() * 1000
+        files[str(tmp_path / f"{i}.csv")] = f"{server.url}/{i}.csv"
+
+    assert download_many(files, max_workers=3) == list(files)
+    for i, fn in enumerate(files):
+        with open(fn, "rb") as f:
+            assert f.read() == str(i).encode() * 1000
+
+    files[str(tmp_path / "missing.csv")] = server.url + "/missing.csv"
+    with pytest.raises(requests.HTTPError):
+        download_many(files, update=True)
+    assert len(server.requests) == 5 + 6
+
+
+def test_retrieve_raw_files(server, monkeypatch, tmp_path):
+    monkeypatch.setitem(package_config, "data_dir", tmp_path)
+    os.makedirs(tmp_path / "data" / "in")
+    server.files["/one.csv"] = b"one"
+    server.files["/two.csv"] = b"two"
+    config = get_config(
+        ONE={"fn": "one.csv", "url": server.url + "/one.csv"},
+        TWO={"fn": "two.csv", "url": server.url + "/two.csv"},
+        LOCAL={"fn": "local.csv"},
+    )
+
+    retrieve_raw_files(["ONE", "TWO", "LOCAL", "UNKNOWN"], config=config)
+    assert len(server.requests) == 2
+
+    fn = get_raw_file("ONE", config=config)
+    assert fn == str(tmp_path / "data" / "in" / "one.csv")
+    with open(fn, "rb") as f:
+        assert f.read() == b"one"
+    assert len(server.requests) == 2
+
+    get_raw_file("ONE", update=True, config=config)
+    assert len(server.requests) == 3
@@ -2,10 +2,31 @@
 #
 # SPDX-License-Identifier: MIT
 
+import sys
+
 import numpy as np
 import pandas as pd
+import pytest
 
-from powerplantmatching.duke import add_geoposition_for_duke, duke
+from powerplantmatching.core import _package_data
+from powerplantmatching.duke import (
+    DukeWorker,
+    DukeWorkerPool,
+    add_geoposition_for_duke,
+    duke,
+    duke_records,
+)
+from powerplantmatching.native import (
+    duke_native,
+    geoposition,
+    jaro_winkler_tokenized,
+    pair_similarities,
+    read_duke_config,
+    read_similarities,
+    score_similarities,
+    similarities_file,
+    source_features,
+)
 
 TEST_DATA = {
     "Name": [
@@ -59,18 +80,39 @@ def test_add_geoposition_for_duke():
 
     pd.testing.assert_frame_equal(output, expected)
 
+    # a single missing coordinate is passed on as in str(np.nan)
+    output = add_geoposition_for_duke(df.assign(lon=[np.nan, *df.lon[1:]]))
+    assert output.Geoposition[0] == "51.5074,nan"
+
+
+def test_duke_records():
+    df = pd.DataFrame(TEST_DATA).assign(projectID="x")
+    xml = """<csv>
+      <column name="id" property="ID"/>
+      <column name="Name" property="NAME"/>
+      <column name="Geoposition" property="GEOPOSITION"/>
+    </csv>"""
+
+    records = duke_records(df, xml).splitlines()
+
+    assert records[0] == "id,Name,Geoposition"
+    assert records[1] == '0,Powerplant,"51.5074,-0.1278"'
+    assert len(records) == len(df) + 1
 
-def test_duke_deduplication_mode():
+
+@pytest.mark.parametrize("engine", ["java", "worker", "native"])
+def test_duke_deduplication_mode(engine):
     df = pd.DataFrame(TEST_DATA)
 
     expected = pd.DataFrame({"one": [0, 1], "two": [1, 0]})
 
-    output = duke(df)
+    output = duke(df, engine=engine)
 
     pd.testing.assert_frame_equal(output, expected)
 
 
-def test_duke_record_linkage_mode():
+@pytest.mark.parametrize("engine", ["java", "worker", "native"])
+def test_duke_record_linkage_mode(engine):
     df1 = pd.DataFrame(TEST_DATA)
 
     df2 = pd.DataFrame(TEST_DATA)
@@ -92,6 +134,272 @@ def test_duke_record_linkage_mode():
         }
     )
 
-    output = duke([df1, df2], labels=["one", "two"], singlematch=False)
+    output = duke([df1, df2], labels=["one", "two"], singlematch=False, engine=engine)
+
+    pd.testing.assert_frame_equal(output, expected)
+
+
+def synthetic_plants(n, seed):
+    """
+    Random power plants with overlapping names, close positions and the
+    edge cases of duke's comparators (repeated tokens, hyphens, accents,
+    special whitespaces, missing and single coordinates, zero capacities).
+    """
+    rng = np.random.default_rng(seed)
+    words = [
+        "kraftwerk",
+        "kraftwerk-nord",
+        "park",
+        "park park",
+        "nord",
+        "müller",
+        "Süd",
+        "Åsen",
+        "ΣΤΑΘΜΟΣ",
+        "wind\xa0park",
+        "solar",
+        "hydro",
+        "ii",
+        "gas",
+    ]
+    names = [" ".join(rng.choice(words, rng.integers(1, 4))) for _ in range(n)]
+    centres = rng.uniform([47, 6], [55, 15], (max(n // 4, 1), 2))
+    # distances of up to about 10 km between plants of the same centre
+    coords = centres[rng.integers(0, len(centres), n)] + rng.normal(0, 0.03, (n, 2))
+    coords[rng.random(n) < 0.1] = np.nan
+    coords[rng.random(n) < 0.05, 1] = np.nan
+    return pd.DataFrame(
+        {
+            "Name": names,
+            "Fueltype": rng.choice(["Hard Coal", "Natural Gas", "Wind", ""], n),
+            "Technology": rng.choice(["CCGT", "Onshore", "Run-Of-River", ""], n),
+            "Country": rng.choice(["Germany", "Austria", ""], n, p=[0.7, 0.25, 0.05]),
+            "Capacity": rng.choice([10, 12, 50, 100, 0, np.nan], n)
+            * rng.uniform(0.9, 1.1, n).round(2),
+            "lat": coords[:, 0].round(4),
+            "lon": coords[:, 1].round(4),
+        }
+    )
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("dedup", [True, False])
+def test_duke_native_reproduces_java(seed, dedup):
+    df1 = synthetic_plants(300, seed)
+    df2 = synthetic_plants(300, seed + 100)
+    datasets = df1 if dedup else [df1, df2]
+
+    expected = duke(datasets, engine="java")
+    output = duke(datasets, engine="native")
+
+    key = ["one", "two"]
+    expected = expected.sort_values(key, ignore_index=True)
+    output = output.sort_values(key, ignore_index=True)
+    pd.testing.assert_frame_equal(output, expected, check_dtype=False, atol=1e-12)
+
+
+def test_duke_native_comparators():
+    vocab = np.array(["park park", "park muller nord", "nord park"], dtype=object)
+    # tokens are matched one-to-one, divided by the smaller number of tokens
+    output = jaro_winkler_tokenized(vocab, np.array([0, 2]), np.array([1, 1]))
+    np.testing.assert_allclose(output, [0.75, 1.0])
+
+    # the similarity decreases from 1 to 0.5 at the maximal distance of
+    # 5 km, beyond it is zero. A single missing coordinate is compared with
+    # 0.5 as duke fails to parse it, positions without coordinates are skipped
+    p1 = np.array([[50.0, 10.0]] * 5)
+    p2 = p1 + [[0, 0], [0.0225, 0], [0.0451, 0], [np.nan, 0], [np.nan, np.nan]]
+    output = geoposition(p1, p2, 5000)
+    np.testing.assert_allclose(output[:4], [1.0, 0.75, 0.0, 0.5], atol=1e-3)
+    assert np.isnan(output[4])
+
+
+FAKE_WORKER = """
+import os, sys
+for line in sys.stdin:
+    args = line.rstrip("\\n").split("\\t")
+    if args == ["crash"]:
+        sys.exit(1)
+    print("LOG\\t" + str(os.getpid()))
+    print("LOG\\t" + " ".join(reversed(args)))
+    print("DONE", flush=True)
+"""
+
+
+@pytest.fixture
+def fake_worker(tmp_path, monkeypatch):
+    """Replace the Java worker by a python process speaking its protocol."""
+    script = tmp_path / "fake_worker.py"
+    script.write_text(FAKE_WORKER)
+    monkeypatch.setattr(DukeWorker, "command", lambda self: [sys.executable, script])
+
+
+def test_duke_worker(fake_worker):
+    worker = DukeWorker()
+    pid, output = worker.run(["a", "b"]).split("\n")
+    assert output == "b a"
+    assert worker.run(["c"]).split("\n") == [pid, "c"]
+
+    # a crash is raised and the worker is restarted with the next run
+    with pytest.raises(RuntimeError, match="crashed"):
+        worker.run(["crash"])
+    assert not worker.alive
+    new_pid, output = worker.run(["d"]).split("\n")
+    assert output == "d" and new_pid != pid
+
+    process = worker.process
+    worker.close()
+    assert worker.process is None and process.returncode == 0
+
+
+def test_duke_worker_pool(fake_worker):
+    pool = DukeWorkerPool(workers=2)
+    assert pool.run(["a"]).endswith("a")
+    assert pool.run(["b"]).endswith("b")
+    # runs are sequential, so the idle worker is reused
+    assert len(pool.started) == 1
+
+    with pytest.raises(RuntimeError):
+        pool.run(["crash"])
+    # the crashed worker is back in the pool and restarted on demand
+    assert pool.run(["c"]).endswith("c")
+    assert len(pool.started) == 1
+
+    processes = [w.process for w in pool.started]
+    pool.close()
+    assert pool.started == [] and pool.idle.empty()
+    assert all(p.returncode == 0 for p in processes)
+
+
+@pytest.mark.parametrize("engine", ["java", "worker", "native"])
+def test_duke_blocking(engine, monkeypatch):
+    df = pd.DataFrame(TEST_DATA).assign(Country=["A", "B", "A", "B", "A"])
+    df = pd.concat([df, df.assign(Capacity=df.Capacity + 1)], ignore_index=True)
+
+    expected = pd.concat(
+        [duke(block, engine=engine) for _, block in df.groupby("Country")]
+    ).sort_values(["one", "two"], ignore_index=True)
 
+    starts = []
+    start = DukeWorker.start
+    monkeypatch.setattr(DukeWorker, "start", lambda w: starts.append(start(w)))
+    output = duke(df, engine=engine, blocking="Country")
+    output = output.sort_values(["one", "two"], ignore_index=True)
+
+    pd.testing.assert_frame_equal(output, expected)
+    assert (df.Country[output.one].values == df.Country[output.two].values).all()
+    # all blocks are run by a single JVM
+    if engine == "java":
+        assert len(starts) == 1
+
+    df2 = df.assign(Capacity=df.Capacity * 1.05)
+    expected = pd.concat(
+        [
+            duke([df.loc[df.Country == c], df2.loc[df2.Country == c]], engine=engine)
+            for c in ["A", "B"]
+        ]
+    ).sort_values(["one", "two"], ignore_index=True)
+    output = duke([df, df2], engine=engine, blocking="Country")
+    output = output.sort_values(["one", "two"], ignore_index=True)
+    pd.testing.assert_frame_equal(output, expected)
+
+
+def test_duke_native_candidates():
+    df1 = pd.DataFrame(TEST_DATA)
+    df2 = pd.DataFrame(TEST_DATA).assign(Capacity=lambda df: df.Capacity + 1)
+    df2.loc[1, "lat"] = None
+
+    expected = duke_native([df1, df2])
+
+    output = duke_native([df1, df2], max_distance=1e9, fueltype_blocking=True)
+    pd.testing.assert_frame_equal(output, expected)
+
+    # records with coordinates are only compared with close records
+    df2.loc[2, ["lat", "lon"]] += 1
+    expected = duke_native([df1, df2]).query("two != 2").reset_index(drop=True)
+
+    output = duke_native([df1, df2], max_distance=10e3)
+    pd.testing.assert_frame_equal(output, expected)
+
+
+def test_duke_native_name_candidates():
+    df1 = pd.DataFrame(TEST_DATA)
+    df2 = pd.DataFrame(TEST_DATA).assign(Capacity=lambda df: df.Capacity + 1)
+    df2.loc[4, "Name"] = None
+
+    # only the records with the most similar names are compared, records
+    # without name are compared with all records
+    output = pair_similarities([df1, df2], name_top_k=1)
+    assert len(output) < len(df1) * len(df2)
+    assert (output.two == 4).sum() == len(df1)
+    expected = duke_native([df1, df2]).query("one == two").reset_index(drop=True)
+    output = duke_native([df1, df2], name_top_k=1)
+    pd.testing.assert_frame_equal(output, expected)
+
+    pd.testing.assert_frame_equal(duke_native(df1, name_top_k=1), duke_native(df1))
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        dict(fueltype_blocking=True),
+        dict(max_distance=20e3),
+        dict(fueltype_blocking=True, max_distance=20e3, blocking="Country"),
+    ],
+)
+@pytest.mark.parametrize("dedup", [True, False])
+def test_duke_native_name_candidates_uneven_blocks(kwargs, dedup):
+    # records without fueltype or coordinates are compared with all records,
+    # the names are thus ranked between differing sets of records
+    df1 = synthetic_plants(300, 0)
+    datasets = df1 if dedup else [df1, synthetic_plants(200, 1)]
+
+    # with more neighbours than records all pairs are compared
+    expected = duke_native(datasets, **kwargs)
+    output = duke_native(datasets, name_top_k=1000, **kwargs)
+    pd.testing.assert_frame_equal(output, expected)
+
+    sims = pair_similarities(datasets, name_top_k=2, **kwargs)
+    pairs = pair_similarities(datasets, **kwargs)[["one", "two"]]
+    assert not sims.duplicated(["one", "two"]).any()
+    assert len(sims.merge(pairs)) == len(sims) < len(pairs)
+    if dedup:
+        assert (sims.one != sims.two).all()
+
+
+def test_source_features():
+    df = pd.DataFrame(TEST_DATA)
+    config = read_duke_config(_package_data("Comparison.xml"))
+
+    features = source_features(df, config)
+    # the features are reused for the same content of the compared columns
+    assert source_features(df.assign(projectID="x"), config) is features
+    assert source_features(df.assign(Capacity=1), config) is not features
+
+    names = features["NAME"]
+    assert names["values"][names["codes"][2]] == "another powerplant with whitespaces"
+    tokens, ntokens = names["tokens"]
+    assert ntokens.sum() == len(tokens)
+
+
+def test_duke_similarities(tmp_path):
+    df1 = pd.DataFrame(TEST_DATA)
+    df2 = pd.DataFrame(TEST_DATA).assign(Capacity=lambda df: df.Capacity * 1.1)
+
+    expected = duke([df1, df2], engine="native")
+    output = duke([df1, df2], engine="native", similarities=tmp_path)
     pd.testing.assert_frame_equal(output, expected)
+
+    # the pairs are stored by index labels with single precision similarities
+    sims = read_similarities(similarities_file(tmp_path, ["one", "two"]))
+    assert len(sims) == len(df1) * len(df2)
+    assert (sims.dtypes[2:] == "float32").all()
+    expected_sims = pair_similarities([df1, df2]).astype(sims.dtypes.to_dict())
+    pd.testing.assert_frame_equal(sims.sort_values(["one", "two"]), expected_sims)
+    rescored = score_similarities(sims)
+    pd.testing.assert_frame_equal(rescored, expected, atol=1e-6)
+
+    # a lower threshold keeps more links, higher bounds increase the scores
+    assert len(score_similarities(sims, threshold=0.5)) > len(expected)
+    boosted = score_similarities(sims, properties={"NAME": {"high": 0.999}})
+    assert len(boosted) > len(expected)
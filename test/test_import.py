@@ -0,0 +1,50 @@
+# SPDX-FileCopyrightText: Contributors to powerplantmatching <https://github.com/pypsa/powerplantmatching>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = [
+    "matplotlib",
+    "seaborn",
+    "entsoe",
+    "country_converter",
+    "powerplantmatching.data",
+    "powerplantmatching.plot",
+]
+
+# modules of the matching, which are only needed once data is processed
+MATCHING_MODULES = [
+    "networkx",
+    "scipy",
+    "powerplantmatching.cleaning",
+    "powerplantmatching.collection",
+    "powerplantmatching.duke",
+    "powerplantmatching.matching",
+    "powerplantmatching.native",
+]
+
+SCRIPT = """
+import json, sys
+import powerplantmatching as pm
+imported = [m for m in {modules} if m in sys.modules]
+pm.powerplants
+heavy = [m for m in {heavy} if m in sys.modules]
+print(json.dumps(dict(imported=imported, heavy=heavy)))
+"""
+
+
+def test_lazy_import():
+    # run in a fresh interpreter, the test session has imported everything
+    script = SCRIPT.format(modules=MATCHING_MODULES, heavy=HEAVY_MODULES)
+    out = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, check=True, text=True
+    )
+    result = json.loads(out.stdout.splitlines()[-1])
+
+    # importing the package does not load the matching, which dominates the
+    # import time, and the heavy dependencies are only imported when used
+    assert result["imported"] == []
+    assert result["heavy"] == []
@@ -0,0 +1,205 @@
+# SPDX-FileCopyrightText: Contributors to powerplantmatching <https://github.com/pypsa/powerplantmatching>
+#
+# SPDX-License-Identifier: MIT
+
+import pandas as pd
+import pytest
+
+from powerplantmatching import utils
+from powerplantmatching.core import get_config
+from powerplantmatching.matching import (
+    best_matches,
+    comparison_costs,
+    cross_matches,
+    link_multiple_datasets,
+    prelink,
+)
+from powerplantmatching.native import read_similarities, similarities_file
+from powerplantmatching.utils import parmap_frames, shared_frame
+
+
+def test_cross_matches():
+    pairs = [
+        pd.DataFrame({"A": [0, 1, 2], "B": [5, 6, 7]}),
+        pd.DataFrame({"A": [0], "C": [9]}),
+        pd.DataFrame({"B": [6], "C": [3]}),
+    ]
+
+    expected = pd.DataFrame({"A": [0, 1, 2], "B": [5, 6, 7], "C": [9.0, 3.0, None]})
+
+    output = cross_matches(pairs, labels=["A", "B", "C"])
+
+    pd.testing.assert_frame_equal(output, expected)
+
+
+def test_cross_matches_conflicts():
+    # A0 and A1 are connected through B5 and C9, A0 has more links
+    pairs = [
+        pd.DataFrame({"A": [0, 0], "B": [5, 8]}),
+        pd.DataFrame({"A": [0, 1], "C": [9, 9]}),
+        pd.DataFrame({"B": [5], "D": [4]}),
+    ]
+
+    output = cross_matches(pairs, labels=["A", "B", "C", "D"])
+
+    assert not output.apply(lambda ds: ds.dropna().duplicated().any()).any()
+    assert output.loc[0, "A"] == 0
+    assert 1 not in output.A.values
+
+
+def test_cross_matches_wrong_link():
+    # A0 is wrongly linked to B1, the correct links of both are kept
+    pairs = [
+        pd.DataFrame({"A": [0, 1, 0], "B": [0, 1, 1]}),
+        pd.DataFrame({"A": [0, 1], "C": [0, 1]}),
+        pd.DataFrame({"B": [0, 1], "C": [0, 1]}),
+    ]
+
+    expected = pd.DataFrame({"A": [0, 1], "B": [0, 1], "C": [0, 1]})
+
+    output = cross_matches(pairs, labels=["A", "B", "C"])
+
+    pd.testing.assert_frame_equal(output.sort_values("A", ignore_index=True), expected)
+
+
+def test_best_matches():
+    links = pd.DataFrame(
+        {
+            "one": [0, 0, 1, 2],
+            "two": [10, 11, 10, 12],
+            "scores": [0.99, 0.98, 0.97, 0.99],
+        }
+    )
+
+    greedy = pd.DataFrame({"one": [0, 0, 2], "two": [10, 11, 12]})
+    pd.testing.assert_frame_equal(best_matches(links), greedy)
+
+    optimal = pd.DataFrame({"one": [0, 1, 2], "two": [11, 10, 12]})
+    pd.testing.assert_frame_equal(best_matches(links, assignment="optimal"), optimal)
+
+
+def len_shared(key):
+    return len(shared_frame(key))
+
+
+def fail_on_second(key):
+    if key == 1:
+        raise ValueError(f"failed on {key}")
+    return len(shared_frame(key))
+
+
+def test_parmap_frames():
+    frames = [pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": [3]})]
+
+    output = parmap_frames(len_shared, frames, [1, 0, 1], costs=[1, 2, 3], threads=2)
+    assert output == [1, 2, 1]
+
+    with pytest.raises(ValueError, match="failed on 1"):
+        parmap_frames(fail_on_second, frames, [0, 1], threads=2)
+
+
+def sum_shared(key):
+    values = shared_frame(key)["a"].to_numpy()
+    # columns without missing values are views on the memory mapped file
+    return values.sum(), values.flags.writeable
+
+
+def test_parmap_frames_reuses_pool():
+    frames = [pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": [3]})]
+    output = parmap_frames(sum_shared, frames, [0, 1], threads=2)
+    assert output == [(3, False), (3, False)]
+    executor = utils._executor
+
+    # the workers are kept, but attach the frames of the new call
+    frames = [df * 10 for df in frames]
+    output = parmap_frames(sum_shared, frames, [1, 0], threads=2)
+    assert output == [(30, False), (30, False)]
+    assert utils._executor is executor
+
+
+def test_link_multiple_datasets_parallel(tmp_path):
+    data = {
+        "Name": ["Aarberg", "Aarwangen", "Abbey Mills", "Abertay"],
+        "Fueltype": ["Hydro", "Hydro", "Other", "Other"],
+        "Technology": ["Run-Of-River", None, None, None],
+        "Country": ["Switzerland"] * 2 + ["United Kingdom"] * 2,
+        "Capacity": [14.5, 11.0, 1.0, 1.9],
+        "lat": [47.0, 47.2, 51.5, 56.5],
+        "lon": [7.3, 7.8, -0.0, -2.9],
+    }
+    dfs = []
+    for name, factor in [("A", 1.0), ("B", 1.01), ("C", 0.99)]:
+        df = pd.DataFrame(data).assign(Capacity=lambda df: df.Capacity * factor)
+        df.columns.name = name
+        dfs.append(df)
+    # entries sharing an EIC code are linked regardless of their similarity
+    dfs[0] = dfs[0].assign(EIC=[None, "11WX", None, None])
+    dfs[1] = dfs[1].assign(EIC=[None, None, None, "11WX"])
+
+    serial = get_config(
+        duke_engine="native", cache_matches=False, prelink_identifiers=["EIC"]
+    )
+    parallel = get_config(
+        duke_engine="native",
+        cache_matches=False,
+        prelink_identifiers=["EIC"],
+        parallel_duke_processes=True,
+        process_limit=2,
+    )
+
+    expected = link_multiple_datasets(dfs, ["A", "B", "C"], config=serial)
+    output = link_multiple_datasets(dfs, ["A", "B", "C"], config=parallel)
+
+    pd.testing.assert_frame_equal(output, expected)
+    assert ((expected.A == 1) & (expected.B == 3)).any()
+
+    # every comparison stores its similarities in a file of its own
+    output = link_multiple_datasets(
+        dfs, ["A", "B", "C"], config=parallel, similarities=tmp_path
+    )
+    pd.testing.assert_frame_equal(output, expected)
+    for labels in [["A", "B"], ["A", "C"], ["B", "C"]]:
+        sims = read_similarities(similarities_file(tmp_path, labels))
+        assert list(sims.columns[:2]) == labels
+        assert len(sims) > 0
+
+
+def test_prelink():
+    df1 = pd.DataFrame({"EIC": [{"11WA"}, {"11wb ", "11WC"}, None, "11WD"]})
+    df2 = pd.DataFrame({"EIC": ["11WB", "11WA", "11WD", "11WD", None]})
+
+    expected = pd.DataFrame({"one": [0, 1], "two": [1, 0], "scores": [1.0, 1.0]})
+
+    # 11WD is ambiguous and left to the fuzzy matching
+    output = prelink([df1, df2], ["one", "two"])
+    pd.testing.assert_frame_equal(output, expected)
+
+    # the pre-linking changes the matches and is opt-in
+    assert get_config()["prelink_identifiers"] == []
+
+
+def test_comparison_costs():
+    df1 = pd.DataFrame(
+        {
+            "Country": ["Germany", "Germany", "France", None],
+            "Fueltype": ["Hard Coal", None, "Wind", "Wind"],
+        }
+    )
+    df2 = pd.DataFrame(
+        {
+            "Country": ["Germany", "Spain", "France"],
+            "Fueltype": ["Hard Coal", "Wind", "Solar"],
+        }
+    )
+    config = get_config()
+
+    output = comparison_costs([df1, df2], config)
+    expected = pd.Series({"France": 1, "Germany": 2}).rename_axis("Country")
+    pd.testing.assert_series_equal(output.sort_index(), expected)
+
+    config = get_config(duke_engine="native", native_candidates={"fueltype": True})
+    output = comparison_costs([df1, df2], config)
+    assert output.to_dict() == {"Germany": 2}
+
+    assert comparison_costs([df1, df2], config, country_wise=False).sum() == 6
+    assert comparison_costs([df1.iloc[:0], df2], config).empty